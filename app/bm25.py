@@ -0,0 +1,63 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from .chunking import chunk_document, document_id
+from .context_packer import STOPWORDS
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def tokenize(text):
+    return [t for t in re.findall(r"\w+", text.lower()) if t not in STOPWORDS]
+
+class BM25Index:
+    """
+    In-process Okapi BM25 over the same chunks that are uploaded to the vector
+    index (same ids), for exact brand/product name matches that embeddings
+    tend to blur.
+    """
+
+    def __init__(self, chunks, k1=BM25_K1, b=BM25_B):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(chunk position, term frequency)]
+        self.lengths = []
+        for position, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk["title"] + "\n" + chunk["content"]))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((position, tf))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    @classmethod
+    def from_records(cls, docs):
+        chunks = []
+        for doc in docs:
+            if doc.get("content", "").strip():
+                chunks.extend(chunk_document(doc, document_id(doc)))
+        return cls(chunks)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, question, top_k=5, types=None):
+        """Return [(chunk, bm25 score)] of the best top_k chunks (of the given types), best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(question)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for position, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / self.avg_length)
+                scores[position] += idf * tf * (self.k1 + 1) / (tf + norm)
+        if types:
+            scores = {p: score for p, score in scores.items() if self.chunks[p]["type"] in types}
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(self.chunks[position], score) for position, score in best]
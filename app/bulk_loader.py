@@ -0,0 +1,140 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import httpx
+import pinecone
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Requests that never got an answer (timeouts, connection resets). Anything
+# else without a retryable status (TypeError, ValueError, validation errors,
+# 4xx) fails the batch at once.
+TRANSIENT_ERRORS = (
+    TimeoutError, ConnectionError, httpx.TransportError, pinecone.PineconeTimeoutError, pinecone.PineconeConnectionError
+)
+
+def error_status(error):
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    return int(status) if isinstance(status, (int, str)) and str(status).isdigit() else None
+
+def is_too_large(error):
+    message = str(error).lower()
+    return error_status(error) == 413 or (
+        error_status(error) == 400 and any(s in message for s in ("too large", "exceeds", "maximum"))
+    )
+
+def is_retryable(error):
+    return error_status(error) in RETRYABLE_STATUSES or isinstance(error, TRANSIENT_ERRORS)
+
+class BulkLoader:
+    """
+    Upserts records with `workers` concurrent batch requests. The batch size
+    adapts: it grows after successful batches (up to max_batch_size), halves
+    on throttling, and batches rejected as too large are split. Throttled or
+    failed requests are retried with exponential backoff and jitter. Each
+    committed batch is appended to `checkpoint_path` (one JSON line of
+    {id: hash}), so a killed run can resume from it via read_checkpoint().
+    """
+
+    def __init__(self, upsert_batch, checkpoint_path, record_hash, batch_size=32, min_batch_size=1,
+                 max_batch_size=96, workers=4, max_retries=6, base_delay=1.0):
+        self.upsert_batch = upsert_batch
+        self.checkpoint_path = checkpoint_path
+        self.record_hash = record_hash
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._lock = threading.Lock()
+        # Separate lock for pulling from the source, which may block while
+        # the scraper is still producing records.
+        self._source_lock = threading.Lock()
+        self._pending = deque()  # batches to (re)try before taking new records
+        self._records = None
+        self.committed = {}
+        self.failed = []
+
+    def _next_batch(self):
+        with self._lock:
+            if self._pending:
+                return self._pending.popleft()
+            batch_size = self.batch_size
+        with self._source_lock:
+            batch = list(islice(self._records, batch_size))
+        return batch or None
+
+    def _shrink(self):
+        with self._lock:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+
+    def _grow(self):
+        with self._lock:
+            self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 4))
+
+    def _commit(self, batch):
+        hashes = {record["_id"]: self.record_hash(record) for record in batch}
+        with self._lock:
+            with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(hashes) + "\n")
+            self.committed.update(hashes)
+            done = len(self.committed)
+        print(f"Committed {len(batch)} records ({done} so far, batch size {self.batch_size})")
+
+    def _upload(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.upsert_batch(batch)
+            except Exception as e:
+                if is_too_large(e) and len(batch) > 1:
+                    # Split and let the halves be picked up again.
+                    self._shrink()
+                    middle = len(batch) // 2
+                    with self._lock:
+                        self._pending.extendleft([batch[middle:], batch[:middle]])
+                    return
+                if not is_retryable(e) or attempt == self.max_retries:
+                    print(f"Giving up on batch of {len(batch)} ({batch[0]['_id']}...): {e}")
+                    with self._lock:
+                        self.failed.extend(batch)
+                    return
+                if error_status(e) == 429:
+                    self._shrink()
+                delay = self.base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+                print(f"Upsert failed ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+            else:
+                self._commit(batch)
+                self._grow()
+                return
+
+    def _worker(self):
+        while (batch := self._next_batch()) is not None:
+            self._upload(batch)
+
+    def load(self, records):
+        """Upload records from any iterable; returns (committed {id: hash}, failed records)."""
+        self._records = iter(records)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for future in [pool.submit(self._worker) for _ in range(self.workers)]:
+                future.result()
+        return self.committed, self.failed
+
+def read_checkpoint(checkpoint_path):
+    """Return {id: hash} of every batch committed by an earlier, unfinished run."""
+    committed = {}
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        committed.update(json.loads(line))
+                    except json.JSONDecodeError:
+                        break  # torn last line from a killed run
+    except FileNotFoundError:
+        pass
+    return committed
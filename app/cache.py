@@ -0,0 +1,155 @@
+import os
+import re
+import time
+from collections import OrderedDict
+import numpy as np
+from .corpus import current_corpus_version
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "86400"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048"))
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+class LRUCache:
+    """
+    Size-bounded LRU cache with per-entry TTL, tagged with the corpus version:
+    every entry is dropped once embedder.py publishes a new version (noticed
+    within CORPUS_VERSION_CHECK_SECONDS).
+    Meant to be used from the event loop thread only.
+    """
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._version = current_corpus_version()
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _check_version(self):
+        version = current_corpus_version()
+        if version != self._version:
+            self.clear()
+            self._version = version
+
+    def get(self, key):
+        self._check_version()
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] < time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        self._check_version()
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"size": len(self), "hits": self.hits, "misses": self.misses}
+
+class SemanticCache:
+    """
+    LRU + TTL cache of answers keyed by question embedding. A lookup hits when
+    the stored question is identical after normalization, or when its
+    embedding's cosine similarity to the new one reaches `threshold`. The
+    whole cache is dropped when the corpus version changes.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, maxsize=ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._version = current_corpus_version()
+        self._order = OrderedDict()  # key -> slot, least recently used first
+        self._entries = [None] * maxsize  # slot -> (key, value, expires_at)
+        self._matrix = None  # slot -> unit-length embedding
+        self._occupied = np.zeros(maxsize, dtype=bool)
+
+    def __len__(self):
+        return len(self._order)
+
+    def clear(self):
+        self._order.clear()
+        self._entries = [None] * self.maxsize
+        self._occupied[:] = False
+
+    def _check_version(self):
+        version = current_corpus_version()
+        if version != self._version:
+            self.clear()
+            self._version = version
+
+    def _evict(self, slot):
+        key = self._entries[slot][0]
+        del self._order[key]
+        self._entries[slot] = None
+        self._occupied[slot] = False
+
+    def _find(self, key, vector):
+        slot = self._order.get(key)
+        if slot is not None or vector is None or self._matrix is None or not self._occupied.any():
+            return slot
+        sims = self._matrix @ vector
+        sims[~self._occupied] = -1.0
+        best = int(np.argmax(sims))
+        return best if sims[best] >= self.threshold else None
+
+    def get(self, key, vector):
+        self._check_version()
+        vector = _unit(vector) if vector is not None else None
+        slot = self._find(key, vector)
+        if slot is not None and self._entries[slot][2] < time.monotonic():
+            self._evict(slot)
+            slot = None
+        if slot is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._order.move_to_end(self._entries[slot][0])
+        return self._entries[slot][1]
+
+    def put(self, key, vector, value):
+        self._check_version()
+        vector = _unit(vector)
+        if self._matrix is None:
+            self._matrix = np.zeros((self.maxsize, len(vector)), dtype=np.float32)
+        slot = self._order.get(key)
+        if slot is None:
+            if len(self._order) >= self.maxsize:
+                self._evict(next(iter(self._order.values())))
+            slot = int(np.argmin(self._occupied))
+        self._order[key] = slot
+        self._order.move_to_end(key)
+        self._entries[slot] = (key, value, time.monotonic() + self.ttl)
+        self._matrix[slot] = vector
+        self._occupied[slot] = True
+
+    def stats(self):
+        return {"size": len(self), "hits": self.hits, "misses": self.misses}
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,116 @@
+import os
+import re
+import hashlib
+from .context_packer import count_tokens
+
+# Target chunk size and the overlap carried between consecutive windows of a
+# long section, both in tokens.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+# Sections smaller than this are merged into the next one.
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "40"))
+
+# Block headers emitted by scraper.py.
+SECTION_HEADERS = ("Ingredients:", "Instructions:", "Nutrition Information:", "Tips:", "Features and Benefits:")
+
+def document_id(doc):
+    """Stable page id derived from its URL (or its text when it has none), e.g. "recipe-1f3a9c0e5b7d2a64"."""
+    key = doc.get("url") or (doc.get("title", "") + "\n" + doc.get("content", ""))
+    return f"{doc.get('type', 'item')}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}"
+
+def split_sections(content):
+    """Split scraped content into [(section name, text)] on the scraper's block headers."""
+    sections = []
+    for block in content.split("\n\n"):
+        block = block.strip()
+        if not block:
+            continue
+        first_line = block.split("\n", 1)[0].strip()
+        if first_line in SECTION_HEADERS:
+            sections.append((first_line.rstrip(":").lower(), block))
+        elif sections and sections[-1][0] == "body":
+            sections[-1] = ("body", sections[-1][1] + "\n\n" + block)
+        else:
+            sections.append(("body", block))
+    return sections
+
+def split_units(text, max_tokens):
+    """Break text into lines, and lines longer than max_tokens into word runs."""
+    units = []
+    for line in text.split("\n"):
+        if not line.strip():
+            continue
+        if count_tokens(line) <= max_tokens:
+            units.append(line)
+            continue
+        run = []
+        for word in re.split(r"(?<=\S)\s+", line):
+            if run and count_tokens(" ".join(run + [word])) > max_tokens:
+                units.append(" ".join(run))
+                run = []
+            run.append(word)
+        if run:
+            units.append(" ".join(run))
+    return units
+
+def window_section(text, max_tokens=CHUNK_MAX_TOKENS, overlap=CHUNK_OVERLAP_TOKENS):
+    """Split a section into windows of at most max_tokens, overlapping by ~overlap tokens."""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    units = split_units(text, max_tokens)
+    windows, current = [], []
+    for unit in units:
+        if current and count_tokens("\n".join(current + [unit])) > max_tokens:
+            windows.append("\n".join(current))
+            # Carry trailing units into the next window as overlap.
+            carried = []
+            while current and count_tokens("\n".join([current[-1]] + carried + [unit])) <= max_tokens \
+                    and count_tokens("\n".join(carried)) < overlap:
+                carried.insert(0, current.pop())
+            current = carried
+        current.append(unit)
+    if current:
+        windows.append("\n".join(current))
+    return windows
+
+def chunk_document(doc, doc_id, max_tokens=CHUNK_MAX_TOKENS, overlap=CHUNK_OVERLAP_TOKENS):
+    """
+    Split one scraped page into chunk records. Chunks follow the page's
+    sections (description, Ingredients, Instructions, Nutrition Information,
+    ...), long sections are windowed with overlap, and each chunk's content
+    starts with the page title (and, for windows of a long section, the section
+    header) so it embeds with its context. Chunk ids are
+    f"{doc_id}#{n}" and every chunk carries its parent_id.
+    """
+    title = doc.get("title", "").strip()
+    sections = split_sections(doc.get("content", ""))
+
+    merged = []
+    for name, text in sections:
+        if merged and count_tokens(merged[-1][1]) < CHUNK_MIN_TOKENS \
+                and count_tokens(merged[-1][1] + "\n\n" + text) <= max_tokens:
+            merged[-1] = (merged[-1][0], merged[-1][1] + "\n\n" + text)
+        else:
+            merged.append((name, text))
+
+    chunks = []
+    room = max_tokens - (count_tokens(title) + 1 if title else 0)
+    for name, text in merged:
+        header, _, rest = text.partition("\n")
+        if count_tokens(text) > room and header in SECTION_HEADERS and rest:
+            # Repeat the section header on every window of a long section.
+            windows = [f"{header}\n{w}" for w in window_section(rest, room - count_tokens(header) - 1, overlap)]
+        else:
+            windows = window_section(text, room, overlap)
+        for window in windows:
+            chunks.append({
+                "id": f"{doc_id}#{len(chunks)}",
+                "parent_id": doc_id,
+                "chunk_index": len(chunks),
+                "section": name,
+                "title": doc.get("title", ""),
+                "url": doc.get("url", ""),
+                "type": doc.get("type", ""),
+                "content": f"{title}\n{window}" if title else window,
+            })
+    return chunks
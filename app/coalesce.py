@@ -0,0 +1,27 @@
+import asyncio
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls by key: while a call for a key is running,
+    later callers with the same key await its result instead of starting
+    their own. Must be used from a single event loop.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._inflight = {}
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so a caller that disconnects doesn't cancel the shared call
+        # for everyone else waiting on it.
+        return await asyncio.shield(task)
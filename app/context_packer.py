@@ -0,0 +1,121 @@
+import os
+import re
+import tiktoken
+from .request_log import log
+
+# Maximum prompt tokens spent on retrieved context (titles, URLs and content).
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Paragraphs longer than this are split into lines before ranking.
+MAX_PASSAGE_TOKENS = 120
+TOKENIZER_ENCODING = "o200k_base"  # gpt-4o / gpt-4o-mini
+
+STOPWORDS = {
+    "a", "an", "and", "are", "can", "do", "does", "for", "from", "have", "how", "i", "in", "is",
+    "it", "me", "many", "much", "of", "on", "or", "the", "there", "to", "what", "which", "with", "you",
+}
+
+_encoding = None
+
+def get_encoding():
+    """
+    Load the tokenizer once. tiktoken downloads its BPE file on first use (set
+    TIKTOKEN_CACHE_DIR to ship it offline); if that fails we fall back to a
+    ~4 characters per token estimate rather than failing requests.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            log(f"Could not load tokenizer {TOKENIZER_ENCODING}, estimating token counts: {e}")
+            _encoding = False
+    return _encoding
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def truncate_tokens(text, max_tokens):
+    encoding = get_encoding()
+    if encoding:
+        return encoding.decode(encoding.encode(text)[:max_tokens])
+    return text[:max_tokens * 4]
+
+def terms(text):
+    return {t for t in re.findall(r"\w+", text.lower()) if t not in STOPWORDS}
+
+def split_passages(content):
+    """Split content into paragraphs, and oversized paragraphs into lines."""
+    passages = []
+    for paragraph in content.split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= MAX_PASSAGE_TOKENS:
+            passages.append(paragraph)
+        else:
+            passages.extend(line.strip() for line in paragraph.split("\n") if line.strip())
+    return passages
+
+def chunk_overhead(chunk):
+    # Matches the per-chunk template in llm.build_system_prompt.
+    return count_tokens(f"- Title: {chunk['title']}\n  URL: {chunk['url']}\n  Content: \n\n")
+
+def trim_chunk(question_terms, content, max_tokens):
+    """Keep the passages sharing the most terms with the question, in page order."""
+    passages = split_passages(content)
+    ranked = sorted(
+        range(len(passages)),
+        key=lambda i: (-len(question_terms & terms(passages[i])), i),
+    )
+    keep, used = [], 0
+    for i in ranked:
+        cost = count_tokens(passages[i]) + 1  # + the joining newline
+        if used + cost <= max_tokens:
+            keep.append(i)
+            used += cost
+    if not keep and passages:
+        # Not even the best passage fits: cut it down instead of dropping the chunk.
+        return truncate_tokens(passages[ranked[0]], max_tokens)
+    return "\n".join(passages[i] for i in sorted(keep))
+
+def pack_context(question, context_chunks, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Fit retrieved chunks into `budget` tokens. Chunks are grouped by URL (at
+    the position of the best ranked one); each page gets an equal share of
+    what is left, with unused tokens rolling over to the next, and is trimmed
+    to its most relevant passages. Returns (packed_chunks, tokens_used); input
+    chunks are not modified.
+    """
+    # Chunks of the same page are merged into one entry at the page's best
+    # rank, so the title/URL are paid for once and repeated text is dropped.
+    by_url, unique = {}, []
+    for chunk in context_chunks:
+        key = chunk.get("url") or chunk["content"]
+        if key not in by_url:
+            by_url[key] = {**chunk}
+            unique.append(by_url[key])
+            continue
+        # Chunks start with the page title (see chunking.py); keep it once.
+        content = chunk["content"].removeprefix(f"{chunk['title']}\n") if chunk["title"] else chunk["content"]
+        if content not in by_url[key]["content"]:
+            by_url[key]["content"] += "\n\n" + content
+
+    question_terms = terms(question)
+    packed, used = [], 0
+    for position, chunk in enumerate(unique):
+        share = (budget - used) // (len(unique) - position)
+        room = share - chunk_overhead(chunk)
+        if room <= 0:
+            continue
+        if count_tokens(chunk["content"]) <= room:
+            content = chunk["content"]
+        else:
+            content = trim_chunk(question_terms, chunk["content"], room)
+        if not content:
+            continue
+        packed.append({**chunk, "content": content})
+        used += chunk_overhead(chunk) + count_tokens(content)
+    return packed, used
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import uuid
+from pathlib import Path
+
+# Scraped data lives next to the app package, regardless of the working dir.
+DATA_DIR = Path(__file__).resolve().parent.parent / "data" / "raw_pages"
+# Scraped pages, one JSON record per line. The scraper appends to the
+# ".partial" file while it runs and renames it when done. The single-array
+# PROCESSED_PATH written by older scrapers is still readable.
+PROCESSED_JSONL_PATH = DATA_DIR / "processed.jsonl"
+PROCESSED_PATH = DATA_DIR / "processed.json"
+# Pages that are new, changed or gone, one numbered file per scraper run
+# (000001.jsonl, ...). `python -m app.embedder --changes` applies every pending
+# file and deletes them once they are uploaded. Removed pages are
+# {"url", "type", "deleted": true}.
+CHANGES_DIR = DATA_DIR / "changes"
+FOLLOW_POLL_SECONDS = 1.0
+# A follower gives up when the scraper's output hasn't grown for this long
+# (e.g. the scraper was killed and left its ".partial" file behind).
+FOLLOW_IDLE_SECONDS = float(os.getenv("FOLLOW_IDLE_SECONDS", "600"))
+# Written by embedder.py after every upload. Caches compare against it to
+# notice a re-ingested index; point it at shared storage when the backend and
+# the embedder run on different machines.
+CORPUS_VERSION_PATH = Path(os.getenv("CORPUS_VERSION_PATH", DATA_DIR / "corpus_version.txt"))
+# Caches look at the version file at most this often; a new upload is noticed
+# within that many seconds.
+CORPUS_VERSION_CHECK_SECONDS = float(os.getenv("CORPUS_VERSION_CHECK_SECONDS", "5"))
+
+_corpus_version = None
+_corpus_version_checked_at = 0.0
+
+def read_corpus_version():
+    try:
+        return CORPUS_VERSION_PATH.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return ""
+
+def current_corpus_version():
+    """read_corpus_version, re-read from disk at most every CORPUS_VERSION_CHECK_SECONDS."""
+    global _corpus_version, _corpus_version_checked_at
+    now = time.monotonic()
+    if _corpus_version is None or now - _corpus_version_checked_at >= CORPUS_VERSION_CHECK_SECONDS:
+        _corpus_version = read_corpus_version()
+        _corpus_version_checked_at = now
+    return _corpus_version
+
+def bump_corpus_version():
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    CORPUS_VERSION_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = CORPUS_VERSION_PATH.with_suffix(".tmp")
+    tmp_path.write_text(version, encoding="utf-8")
+    tmp_path.replace(CORPUS_VERSION_PATH)
+    return version
+
+def partial_path(path):
+    return Path(path).with_name(Path(path).name + ".partial")
+
+def failed_path(path):
+    return Path(path).with_name(Path(path).name + ".failed")
+
+def next_changes_path():
+    """Path of the next numbered changes file in CHANGES_DIR."""
+    numbers = [int(path.name.split(".")[0]) for path in CHANGES_DIR.glob("*.jsonl*") if path.name.split(".")[0].isdigit()]
+    return CHANGES_DIR / f"{max(numbers, default=0) + 1:06d}.jsonl"
+
+def pending_changes():
+    """Finished changes files not applied yet, oldest first."""
+    return sorted(CHANGES_DIR.glob("[0-9]*.jsonl"))
+
+def iter_changes(paths):
+    """The latest change per URL across the changes files, in order of their last change."""
+    latest = {}
+    for path in paths:
+        for doc in iter_records(path):
+            latest.pop(doc["url"], None)
+            latest[doc["url"]] = doc
+    yield from latest.values()
+
+def default_records_path():
+    return PROCESSED_JSONL_PATH if PROCESSED_JSONL_PATH.exists() or not PROCESSED_PATH.exists() else PROCESSED_PATH
+
+def iter_records(path=None, follow=False):
+    """
+    Yield scraped page records one at a time.
+
+    `path` may be a .jsonl file (read lazily, line by line) or a legacy .json
+    array (loaded whole). With follow=True, records are yielded while the
+    scraper is still writing the .jsonl ".partial" file, and iteration ends
+    once the scraper renames it to its final name. Raises RuntimeError if
+    the scraper reports a failure, and TimeoutError if nothing new arrives
+    for FOLLOW_IDLE_SECONDS.
+    """
+    path = Path(path) if path else default_records_path()
+    if path.suffix == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+    if not follow or (path.exists() and not partial_path(path).exists()):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    partial, failed = partial_path(path), failed_path(path)
+    idle_since = time.monotonic()
+
+    def wait():
+        if failed.exists():
+            raise RuntimeError(f"The scraper failed while writing {partial}")
+        if time.monotonic() - idle_since > FOLLOW_IDLE_SECONDS:
+            raise TimeoutError(f"{partial} hasn't changed for {FOLLOW_IDLE_SECONDS:.0f}s; is the scraper still running?")
+        time.sleep(FOLLOW_POLL_SECONDS)
+
+    while not partial.exists():
+        if path.exists():
+            yield from iter_records(path)
+            return
+        wait()
+    with open(partial, "r", encoding="utf-8") as f:
+        pending = ""
+        while True:
+            line = f.readline()
+            if line:
+                idle_since = time.monotonic()
+            if line.endswith("\n"):
+                if (pending + line).strip():
+                    yield json.loads(pending + line)
+                pending = ""
+            elif line:
+                pending += line  # the scraper is mid-write; wait for the newline
+            elif not partial.exists():
+                # Renamed: the scraper is done; drain whatever it wrote last.
+                for rest in (pending + f.read()).splitlines():
+                    if rest.strip():
+                        yield json.loads(rest)
+                return
+            else:
+                wait()
+
+class RecordWriter:
+    """
+    Appends records to `path` as JSON lines, flushing each one so followers
+    see it immediately. Writes go to the ".partial" file; close() (or leaving
+    the `with` block without an error) renames it into place. Leaving it
+    with an error writes a ".failed" marker so followers stop waiting.
+    """
+
+    def __init__(self, path=PROCESSED_JSONL_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.count = 0
+        failed_path(self.path).unlink(missing_ok=True)
+        self._file = open(partial_path(self.path), "w", encoding="utf-8")
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+        partial_path(self.path).replace(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Leave a failed run's output as .partial: a truncated corpus must
+            # not be mistaken for a complete one (the embedder would delete
+            # every page missing from it).
+            self._file.close()
+            failed_path(self.path).write_text(f"{exc_type.__name__}: {exc}\n", encoding="utf-8")
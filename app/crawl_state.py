@@ -0,0 +1,109 @@
+import hashlib
+import json
+import sqlite3
+import time
+from .corpus import DATA_DIR
+
+# Per-URL crawl state kept between scraper runs.
+CRAWL_STATE_PATH = DATA_DIR / "crawl_state.sqlite3"
+COMMIT_EVERY = 100
+
+def content_hash(record):
+    return hashlib.sha256(json.dumps(record, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class CrawlState:
+    """
+    SQLite table of every scraped URL: its HTTP validators (ETag,
+    Last-Modified), the last extracted record and its hash, and when it was
+    last crawled / last changed, and for how many runs in a row it has been
+    missing from the link lists. Lets a re-crawl send conditional requests,
+    reuse records of unchanged pages and report only the pages that changed.
+    Use from one thread.
+    """
+
+    def __init__(self, path=CRAWL_STATE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                record_hash TEXT NOT NULL,
+                record TEXT NOT NULL,
+                crawled_at REAL NOT NULL,
+                changed_at REAL NOT NULL,
+                missing_runs INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(pages)")}
+        if "missing_runs" not in columns:  # state files from before removals were deferred
+            self.db.execute("ALTER TABLE pages ADD COLUMN missing_runs INTEGER NOT NULL DEFAULT 0")
+        self._pending = 0
+
+    def validators(self):
+        """{url: (etag, last_modified)} for pages that have at least one validator."""
+        rows = self.db.execute(
+            "SELECT url, etag, last_modified FROM pages WHERE etag IS NOT NULL OR last_modified IS NOT NULL"
+        )
+        return {url: (etag, last_modified) for url, etag, last_modified in rows}
+
+    def record(self, url):
+        row = self.db.execute("SELECT record FROM pages WHERE url = ?", (url,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def urls(self):
+        return {url: kind for url, kind in self.db.execute("SELECT url, type FROM pages")}
+
+    def save(self, record, etag=None, last_modified=None):
+        """Store a freshly extracted record; returns True if it is new or its content changed."""
+        now = time.time()
+        current = content_hash(record)
+        row = self.db.execute("SELECT record_hash FROM pages WHERE url = ?", (record["url"],)).fetchone()
+        changed = row is None or row[0] != current
+        self.db.execute(
+            """INSERT INTO pages (url, type, etag, last_modified, record_hash, record, crawled_at, changed_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(url) DO UPDATE SET
+                   type = excluded.type, etag = excluded.etag, last_modified = excluded.last_modified,
+                   record_hash = excluded.record_hash, record = excluded.record, crawled_at = excluded.crawled_at,
+                   missing_runs = 0,
+                   changed_at = CASE WHEN pages.record_hash = excluded.record_hash
+                                     THEN pages.changed_at ELSE excluded.changed_at END""",
+            (record["url"], record["type"], etag, last_modified, current,
+             json.dumps(record, ensure_ascii=False), now, now),
+        )
+        self._written()
+        return changed
+
+    def touch(self, url):
+        """Mark an unchanged page (HTTP 304) as crawled now."""
+        self.db.execute("UPDATE pages SET crawled_at = ?, missing_runs = 0 WHERE url = ?", (time.time(), url))
+        self._written()
+
+    def listed(self, url):
+        """The page is in the link lists again (even if it couldn't be scraped this run)."""
+        self.db.execute("UPDATE pages SET missing_runs = 0 WHERE url = ?", (url,))
+        self._written()
+
+    def mark_missing(self, url):
+        """Count one more run without the page in the link lists; returns the count."""
+        self.db.execute("UPDATE pages SET missing_runs = missing_runs + 1 WHERE url = ?", (url,))
+        self._written()
+        row = self.db.execute("SELECT missing_runs FROM pages WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else 0
+
+    def delete(self, url):
+        self.db.execute("DELETE FROM pages WHERE url = ?", (url,))
+        self._written()
+
+    def _written(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.db.commit()
+            self._pending = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -1,47 +1,177 @@
 import os
 import json
+import argparse
+import hashlib
 from pinecone import Pinecone
 from dotenv import load_dotenv
+from .bulk_loader import BulkLoader, read_checkpoint
+from .chunking import chunk_document, document_id
+from .corpus import DATA_DIR, bump_corpus_version, iter_changes, iter_records, pending_changes
 
 load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 INDEX_HOST = os.getenv("PINECONE_HOST")  # Use your index host
 NAMESPACE = "default"  # or "" if not using namespaces
+# Content hash of every record currently in the index, by record id.
+MANIFEST_PATH = DATA_DIR / "embed_manifest.json"
+# Batches committed by the current (or an interrupted) run, one JSON line each.
+CHECKPOINT_PATH = DATA_DIR / "embed_checkpoint.jsonl"
+DELETE_BATCH_SIZE = 1000
+
+def build_records(docs):
+    # Pinecone expects each record to have "_id" and the record field (for integrated embedding).
+    # Pages are split into section-aware chunks; each chunk keeps a parent_id.
+    for doc in docs:
+        text = doc.get("content", "")
+        if not text.strip():
+            continue  # skip empty content
+        for chunk in chunk_document(doc, document_id(doc)):
+            yield {
+                "_id": chunk["id"],
+                "content": chunk["content"],
+                "title": chunk["title"],
+                "url": chunk["url"],
+                "type": chunk["type"],
+                "parent_id": chunk["parent_id"],
+                "section": chunk["section"]
+            }
+
+def track_pages(docs, page_ids):
+    """Pass docs through, adding each page's document_id to page_ids."""
+    for doc in docs:
+        page_ids.add(document_id(doc))
+        yield doc
+
+def record_hash(record):
+    return hashlib.sha256(json.dumps(record, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(manifest):
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    tmp_path.replace(MANIFEST_PATH)
+
+def records_to_upsert(records, manifest, checkpoint, counts, seen_ids, full=False):
+    """Yield the records that need uploading, tallying added/changed/unchanged in counts."""
+    for record in records:
+        seen_ids.add(record["_id"])
+        previous = manifest.get(record["_id"])
+        current = record_hash(record)
+        if previous is None:
+            counts["added"] += 1
+            yield record
+        elif previous != current:
+            counts["changed"] += 1
+            yield record
+        else:
+            counts["unchanged"] += 1
+            if full and checkpoint.get(record["_id"]) != current:
+                yield record
+
+def delete(index, record_ids, manifest):
+    for batch_start in range(0, len(record_ids), DELETE_BATCH_SIZE):
+        batch = record_ids[batch_start: batch_start + DELETE_BATCH_SIZE]
+        index.delete(ids=batch, namespace=NAMESPACE)
+        for record_id in batch:
+            manifest.pop(record_id, None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload scraped pages to Pinecone.")
+    parser.add_argument("--input", help="processed.jsonl (default) or a legacy processed.json")
+    parser.add_argument("--follow", action="store_true",
+                        help="start uploading while the scraper is still writing processed.jsonl")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--full", action="store_true",
+                      help="re-upload every record (still deletes records that vanished)")
+    mode.add_argument("--reset", action="store_true",
+                      help="delete everything in the namespace first, then upload every record")
+    mode.add_argument("--changes", action="store_true",
+                      help="apply only the scraper's pending changes files (new, changed and deleted pages)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent upsert requests")
+    parser.add_argument("--batch-size", type=int, default=32, help="initial records per request (adapts up to 96)")
+    args = parser.parse_args()
+    if args.changes and (args.input or args.follow):
+        parser.error("--changes reads the pending changes files; it can't be combined with --input or --follow")
+    change_files = pending_changes() if args.changes else []
+    if args.changes and not change_files:
+        print("No pending changes.")
+        return
+
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+    index = pc.Index(host=INDEX_HOST)
+
+    if args.reset:
+        CHECKPOINT_PATH.unlink(missing_ok=True)
+        index.delete(delete_all=True, namespace=NAMESPACE)
+    manifest = {} if args.reset else load_manifest()
+    checkpoint = read_checkpoint(CHECKPOINT_PATH)
+    if checkpoint:
+        print(f"Resuming: {len(checkpoint)} records were committed by an interrupted run")
+    elif not manifest and not args.reset:
+        print("No manifest found: uploading everything. Records uploaded under other ids "
+              "(e.g. by older versions of this script) stay in the index; use --reset to clear them.")
+    manifest.update(checkpoint)
+
+    # Pages are read, chunked and diffed lazily as the loader asks for
+    # batches, so memory stays flat regardless of corpus size.
+    # With --changes the input holds only some pages (deleted ones as
+    # {"url", "type", "deleted": true}, which yield no chunks), so only the
+    # chunks of those pages are candidates for removal.
+    counts = {"added": 0, "changed": 0, "unchanged": 0}
+    seen_ids = set()
+    page_ids = set()
+    if args.changes:
+        print(f"Applying {len(change_files)} changes file(s): {', '.join(path.name for path in change_files)}")
+        docs = iter_changes(change_files)
+    else:
+        docs = iter_records(args.input, follow=args.follow)
+    to_upsert = records_to_upsert(
+        build_records(track_pages(docs, page_ids)),
+        manifest, checkpoint, counts, seen_ids, full=args.full,
+    )
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(host=INDEX_HOST)
-
-with open("../data/raw_pages/processed.json", "r", encoding="utf-8") as f:
-    data = json.load(f)
-
-# Pinecone expects each record to have "_id" and the record field (for integrated embedding)
-records = []
-for i, doc in enumerate(data):
-    text = doc.get("content", "")
-    if not text.strip():
-        continue  # skip empty content
-    records.append({
-        "_id": f"{doc.get('type', 'item')}-{i}",
-        "content": text,
-        "title": doc.get("title", ""),
-        "url": doc.get("url", ""),
-        "type": doc.get("type", "")
-    })
-
-
-batch_size = 32
-for batch_start in range(0, len(records), batch_size):
-    batch = records[batch_start: batch_start+batch_size]
     # Only fields "content" will be used for embedding, others as metadata
+    loader = BulkLoader(
+        lambda batch: index.upsert_records(records=batch, namespace=NAMESPACE),
+        CHECKPOINT_PATH,
+        record_hash,
+        batch_size=args.batch_size,
+        workers=args.workers,
+    )
     try:
-        resp = index.upsert_records(
-            NAMESPACE,
-            batch
+        committed, failed = loader.load(to_upsert)
+        manifest.update(committed)
+        removed = sorted(
+            record_id for record_id in manifest
+            if record_id not in seen_ids and (not args.changes or record_id.split("#")[0] in page_ids)
         )
-        print(f"Batch {batch_start // batch_size + 1}: {resp}")
-    except Exception as e:
-        print("Error in upsert:", e)
-        print(batch)
-        break
+        print(f"Added: {counts['added']}, changed: {counts['changed']}, "
+              f"removed: {len(removed)}, unchanged: {counts['unchanged']}")
+        if removed:
+            delete(index, removed, manifest)
+    finally:
+        manifest.update(loader.committed)
+        save_manifest(manifest)
+
+    if committed or removed or args.reset:
+        # Tell the backend's caches that the index content changed.
+        print(f"Corpus version: {bump_corpus_version()}")
+    if failed:
+        print(f"{len(failed)} records failed to upload; run again to retry them.")
+    else:
+        CHECKPOINT_PATH.unlink(missing_ok=True)
+        # Applied; a failed run keeps the files so the next one retries them.
+        for path in change_files:
+            path.unlink()
+        print("Finished uploading to Pinecone via SDK.")
 
-print("Finished uploading to Pinecone via SDK.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import random
+import httpx
+
+# Concurrent HTTP requests to the site when pages are fetched without a browser.
+HTTP_CONCURRENCY = int(os.getenv("SCRAPER_HTTP_CONCURRENCY", "16"))
+HTTP_TIMEOUT = float(os.getenv("SCRAPER_HTTP_TIMEOUT", "20"))
+# Extra attempts (exponential backoff with jitter) for a listing page that fails.
+HTTP_RETRIES = int(os.getenv("SCRAPER_HTTP_RETRIES", "3"))
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept": "text/html,application/xhtml+xml",
+    "Accept-Language": "en-CA,en;q=0.9",
+}
+
+def create_client(concurrency=HTTP_CONCURRENCY):
+    """Async client with one keep-alive pool sized to the request concurrency."""
+    return httpx.AsyncClient(
+        headers=HTTP_HEADERS,
+        follow_redirects=True,
+        timeout=HTTP_TIMEOUT,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    )
+
+async def fetch_text(client, url):
+    """Body of a 200 response, or None on any other status or a network error."""
+    try:
+        response = await client.get(url)
+    except httpx.HTTPError as e:
+        print(f"[{url}] HTTP fetch failed: {e}")
+        return None
+    if response.status_code != 200:
+        print(f"[{url}] HTTP {response.status_code}")
+        return None
+    return response.text
+
+async def fetch_page(client, url, etag=None, last_modified=None):
+    """
+    Conditional GET. Returns {"status", "text", "etag", "last_modified"}
+    ("text" only for a 200; 304 means unchanged since the validators were
+    issued), or None on a network error or any other status.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        response = await client.get(url, headers=headers)
+    except httpx.HTTPError as e:
+        print(f"[{url}] HTTP fetch failed: {e}")
+        return None
+    if response.status_code not in (200, 304):
+        print(f"[{url}] HTTP {response.status_code}")
+        return None
+    return {
+        "status": response.status_code,
+        "text": response.text if response.status_code == 200 else None,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+async def fetch_pages(urls, validators=None, concurrency=HTTP_CONCURRENCY, on_page=None):
+    """
+    fetch_page for all urls ({url: (etag, last_modified)} validators), as
+    {url: page or None}. on_page(url, page) is called as each response
+    arrives, so callers can use pages before the whole batch is done.
+    """
+    validators = validators or {}
+    # The semaphore (not the pool) queues requests, so waiting for a
+    # connection never counts against the request timeout.
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(url):
+        async with semaphore:
+            page = await fetch_page(client, url, *validators.get(url, (None, None)))
+        if on_page is not None:
+            on_page(url, page)
+        return page
+
+    async with create_client(concurrency) as client:
+        pages = await asyncio.gather(*(fetch(url) for url in urls))
+    return dict(zip(urls, pages))
+
+async def fetch_text_retrying(client, url, retries=HTTP_RETRIES, base_delay=1.0):
+    """fetch_text, retried while it fails; None if every attempt failed."""
+    for attempt in range(retries + 1):
+        text = await fetch_text(client, url)
+        if text is not None or attempt == retries:
+            return text
+        delay = base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+        print(f"[{url}] retry {attempt + 1}/{retries} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+def page_url(url, page):
+    return f"{url}{'&' if '?' in url else '?'}page={page}"
+
+async def crawl_listing(client, url, parse_links, window=8, max_pages=200):
+    """
+    Collect links from a paginated listing (Drupal views: `?page=N`) by
+    requesting pages directly, `window` pages at a time, until a page that
+    loaded adds no new links. Returns the set of links, or None when the
+    first page yields nothing or a page still fails after its retries (the
+    caller then falls back to the browser rather than keep a truncated list).
+    """
+    first = await fetch_text_retrying(client, url)
+    links = parse_links(first) if first else set()
+    if not links:
+        return None
+    page = 1
+    while page < max_pages:
+        pages = range(page, min(page + window, max_pages))
+        bodies = await asyncio.gather(*(fetch_text_retrying(client, page_url(url, n)) for n in pages))
+        for n, body in zip(pages, bodies):
+            if body is None:
+                print(f"[{url}] Page {n} could not be fetched; giving up on this listing")
+                return None
+            new = parse_links(body) - links
+            if not new:
+                return links
+            links |= new
+        page += window
+    return links
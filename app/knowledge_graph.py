@@ -0,0 +1,241 @@
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from urllib.parse import urlparse
+from .corpus import DATA_DIR, iter_records
+from .chunking import split_sections
+
+BRAND_PRODUCTS_PATH = DATA_DIR / "brand_products.json"
+# Longest list written into a graph answer; the rest is summarised as a count.
+GRAPH_MAX_ITEMS = int(os.getenv("GRAPH_MAX_ITEMS", "25"))
+
+# Leading quantities and units in recipe ingredient lines ("1 1/2 cups (375 mL) ...").
+QUANTITY = re.compile(
+    r"^(?:[\d½¼¾⅓⅔/.,\s-]+|about|approx\.?|\(.*?\)|"
+    r"(?:cups?|tbsp|tsp|tablespoons?|teaspoons?|ml|l|g|kg|oz|lb|lbs|pkg|packages?|cans?|"
+    r"pinch|dash|large|medium|small|whole)\b\.?)\s*",
+    re.I,
+)
+IGNORED_TOKENS = {"and", "or", "of", "the", "a", "an", "with", "contains", "may", "contain", "less", "than", "from"}
+# Words that change what an entity means ("less sugar", "nut-free", "without
+# milk"); the graph can't express them, so such questions go to retrieval.
+QUALIFIERS = {"less", "than", "no", "non", "not", "without", "free", "low", "lower", "reduced",
+              "fewer", "more", "extra", "except", "excluding"}
+# Words an entity may start with that don't need to match a node name.
+LEADING_WORDS = {"the", "a", "an", "some", "any", "all", "my"}
+
+def normalize(text):
+    """Lowercase, strip accents and trademark signs: "NESTLÉ® SMARTIES®" -> "nestle smarties"."""
+    text = unicodedata.normalize("NFKD", text.replace("®", " ").replace("™", " "))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+def stem(token):
+    if len(token) > 4 and token.endswith("es") and token[-3] in "sxzh":
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def key_tokens(text):
+    return {stem(t) for t in normalize(text).split() if t not in IGNORED_TOKENS}
+
+def product_ingredients(text):
+    """Split a product ingredient list on commas, brackets and semicolons."""
+    names = []
+    for part in re.split(r"[,;()\[\]{}.:]|\band\b", text, flags=re.I):
+        name = normalize(re.sub(r"\d+(?:\.\d+)?\s*%", "", part))
+        if key_tokens(name) and len(name.split()) <= 6:
+            names.append(name)
+    return names
+
+def recipe_ingredient(line):
+    previous = None
+    while previous != line:
+        previous, line = line, QUANTITY.sub("", line.strip(), count=1)
+    line = line.split(",")[0]
+    return normalize(line)
+
+def section_text(content, name):
+    """Text of the named section(s) without the header line."""
+    return "\n".join(text.partition("\n")[2] for section, text in split_sections(content) if section == name)
+
+def brand_name(brand_url):
+    slug = [part for part in urlparse(brand_url).path.split("/") if part]
+    return slug[-1].replace("-", " ").upper() if slug else ""
+
+class KnowledgeGraph:
+    """
+    In-process version of the graph in GRAPHDB.md. Nodes are brands,
+    products, recipes, articles and ingredients; edges are BELONGS_TO
+    (product -> brand), CONTAINS (product/recipe -> ingredient) and MENTIONS
+    (recipe/article -> brand). Edges are kept in both directions, and a
+    token -> node inverted index resolves names from questions.
+    """
+
+    def __init__(self):
+        self.nodes = {}  # node id -> {"kind", "name", "url"}
+        self.out_edges = defaultdict(lambda: defaultdict(set))  # node -> relation -> nodes
+        self.in_edges = defaultdict(lambda: defaultdict(set))
+        self.name_index = defaultdict(set)  # token -> ingredient and brand nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add_node(self, node_id, kind, name, url=""):
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = {"kind": kind, "name": name, "url": url}
+            if kind in ("ingredient", "brand"):
+                for token in key_tokens(name):
+                    self.name_index[token].add(node_id)
+        elif name and not node["name"]:
+            node["name"] = name
+        return node_id
+
+    def add_edge(self, source, relation, target):
+        self.out_edges[source][relation].add(target)
+        self.in_edges[target][relation].add(source)
+
+    @classmethod
+    def build(cls, brand_products=None, docs=None):
+        """Build from brand_products.json entries and scraped page records (defaults: the files on disk)."""
+        if brand_products is None:
+            with open(BRAND_PRODUCTS_PATH, "r", encoding="utf-8") as f:
+                brand_products = json.load(f)
+        if docs is None:
+            docs = iter_records()
+        graph = cls()
+        for entry in brand_products:
+            name = brand_name(entry.get("brand_url", ""))
+            if not name:
+                continue
+            brand = graph.add_node(f"brand:{normalize(name)}", "brand", name, entry["brand_url"])
+            for url in entry.get("products", []):
+                graph.add_edge(graph.add_node(f"product:{url}", "product", "", url), "BELONGS_TO", brand)
+        brands = {
+            node_id: re.compile(rf"\b{re.escape(normalize(node['name']))}\b")
+            for node_id, node in graph.nodes.items() if node["kind"] == "brand"
+        }
+
+        for doc in docs:
+            kind = doc.get("type", "")
+            if kind not in ("product", "recipe", "article"):
+                continue
+            node = graph.add_node(f"{kind}:{doc['url']}", kind, doc.get("title", ""), doc["url"])
+            content = doc.get("content", "")
+            if kind == "product":
+                ingredients = product_ingredients(section_text(content, "ingredients"))
+            elif kind == "recipe":
+                ingredients = [recipe_ingredient(line) for line in section_text(content, "ingredients").split("\n")]
+            else:
+                ingredients = []
+            for name in filter(None, ingredients):
+                graph.add_edge(node, "CONTAINS", graph.add_node(f"ingredient:{name}", "ingredient", name))
+            if kind != "product":
+                text = normalize(doc.get("title", "") + " " + content)
+                for brand, pattern in brands.items():
+                    if pattern.search(text):
+                        graph.add_edge(node, "MENTIONS", brand)
+        return graph
+
+    def find(self, name, kind):
+        """Nodes of a kind whose name contains every key token of `name`."""
+        tokens = key_tokens(name)
+        if not tokens:
+            return set()
+        matches = set.intersection(*(self.name_index.get(token, set()) for token in tokens))
+        return {node_id for node_id in matches if self.nodes[node_id]["kind"] == kind}
+
+    def sources(self, targets, relation, kind):
+        """Nodes of a kind with a `relation` edge into any of the targets."""
+        found = set()
+        for target in targets:
+            edges = self.in_edges.get(target, {}).get(relation, ())
+            found.update(n for n in edges if self.nodes[n]["kind"] == kind)
+        return found
+
+    def products_containing(self, ingredient):
+        return self.sources(self.find(ingredient, "ingredient"), "CONTAINS", "product")
+
+    def recipes_using(self, name):
+        brands = self.find(name, "brand")
+        return (
+            self.sources(self.find(name, "ingredient"), "CONTAINS", "recipe")
+            | self.sources(brands, "MENTIONS", "recipe")
+        )
+
+    def brand_products(self, brand):
+        return self.sources(self.find(brand, "brand"), "BELONGS_TO", "product")
+
+    def items(self, node_ids):
+        """[{"title", "url"}] for nodes, sorted by title."""
+        items = [
+            {"title": self.nodes[n]["name"] or self.nodes[n]["url"], "url": self.nodes[n]["url"]}
+            for n in node_ids
+        ]
+        return sorted(items, key=lambda item: item["title"].lower())
+
+# (pattern, graph method, label) for list/filter questions the graph answers
+# directly; the entity is the pattern's "name" group.
+INTENTS = [
+    (re.compile(r"\b(?:which|what|list|show|find)\b.*?\bproducts?\b.*?\b(?:contain|contains|containing|with|have|has|made with)\s+(?P<name>.+)", re.I),
+     "products_containing", "products containing"),
+    (re.compile(r"\brecipes?\b.*?\b(?:using|use|uses|with|containing|contain|made with|featuring)\s+(?P<name>.+)", re.I),
+     "recipes_using", "recipes using"),
+    (re.compile(r"\b(?:which|what|list|show|all)\b.*?\bproducts?\b\s+(?:does|do|of|from|by|under|in)\s+(?:the\s+)?(?P<name>.+?)(?:\s+(?:brand|make|makes|have|has|sell|sells|offer|offers))?$", re.I),
+     "brand_products", "products from"),
+    (re.compile(r"\b(?:list|show)\s+(?:me\s+)?(?:all\s+)?(?:the\s+)?(?P<name>.+?)\s+products\b", re.I),
+     "brand_products", "products from"),
+]
+
+def plain_entity(name):
+    """
+    True if every word of `name` can be matched against node names: no
+    qualifiers, and no other words that key_tokens would silently drop.
+    """
+    words = normalize(name).split()
+    while words and words[0] in LEADING_WORDS:
+        words = words[1:]
+    return bool(words) and not any(word in QUALIFIERS or word in IGNORED_TOKENS for word in words)
+
+def answer_graph_question(graph, question):
+    """
+    Answer a list/filter question from the graph. Returns (answer, sources),
+    or None when no intent matches, the entity is qualified ("less sugar")
+    or the graph has nothing for it (the caller then falls back to
+    retrieval).
+    """
+    question = question.strip().rstrip("?.! ")
+    for pattern, method, label in INTENTS:
+        match = pattern.search(question)
+        if not match:
+            continue
+        name = match.group("name").strip()
+        if not plain_entity(name):
+            return None
+        items = graph.items(getattr(graph, method)(name))
+        if not items:
+            continue
+        lines = [f"- {item['title']} ({item['url']})" for item in items[:GRAPH_MAX_ITEMS]]
+        if len(items) > GRAPH_MAX_ITEMS:
+            lines.append(f"...and {len(items) - GRAPH_MAX_ITEMS} more.")
+        answer = f"Found {len(items)} {label} {name}:\n" + "\n".join(lines)
+        return answer, items[:GRAPH_MAX_ITEMS]
+    return None
+
+_graph = None
+
+def init_graph():
+    """Build the process-wide graph from the scraped files (idempotent)."""
+    global _graph
+    if _graph is None:
+        _graph = KnowledgeGraph.build()
+        print(f"Knowledge graph built with {len(_graph)} nodes")
+    return _graph
+
+def get_graph():
+    """The graph, or None if it isn't built (e.g. the scraped files are missing)."""
+    return _graph
@@ -1,26 +1,68 @@
 import os
+import re
+import httpx
 import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
+from .context_packer import pack_context
+from .metrics import CONTEXT_TOKENS, ERRORS, LLM_TOKENS, STAGE_SECONDS
+from .request_log import log
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 openai.api_key = OPENAI_API_KEY
 
-def ask_openai_with_context(user_question, context_chunks):
+CHAT_MODEL = "gpt-4o-mini"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Upper bound on concurrent keep-alive connections to the OpenAI API.
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "64"))
+
+async_client = None
+
+def init_client():
+    """Create the process-wide async OpenAI client (idempotent)."""
+    global async_client
+    if async_client is None:
+        async_client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_POOL_SIZE,
+                    max_keepalive_connections=OPENAI_POOL_SIZE,
+                )
+            ),
+        )
+    return async_client
+
+def get_client():
+    return async_client if async_client is not None else init_client()
+
+async def warm_client():
+    # Opens a pooled connection ahead of the first chat completion.
+    await get_client().models.retrieve(CHAT_MODEL)
+
+async def close_client():
+    global async_client
+    if async_client is not None:
+        await async_client.close()
+        async_client = None
+
+NOT_FOUND_REPLY = "The information you requested was not found in the current Made with Nestlé Canada website content."
+
+def build_system_prompt(context_chunks):
     context_string = ''.join(
         f"- Title: {chunk['title']}\n  URL: {chunk['url']}\n  Content: {chunk['content']}\n\n"
         for chunk in context_chunks
     )
 
-    system_prompt = (
+    return (
         f""" You are an AI assistant for the Made with Nestlé Canada website. Use the information provided in the 
         context below to answer user questions as helpfully as possible. The context contains several items, each with 
         a title and a URL. Synthesize and infer answers using any relevant information in the context, even if the 
         answer is not stated exactly as the question. Always reference the specific URL from the context that supports 
         your answer. 
         
-        If you cannot find any relevant information in the context, reply: "The information you requested was not found 
-        in the current Made with Nestlé Canada website content."
+        If you cannot find any relevant information in the context, reply: "{NOT_FOUND_REPLY}"
         
         If the context only partially addresses the question, answer as best as you can and note that the information 
         may not be complete.
@@ -33,16 +75,135 @@ def ask_openai_with_context(user_question, context_chunks):
         """
     )
 
+def build_messages(user_question, context_chunks):
+    # Keep the prompt within CONTEXT_TOKEN_BUDGET: dedupe chunks by URL and
+    # trim each one to the passages most relevant to the question.
+    context_chunks, context_tokens = pack_context(user_question, context_chunks)
+    CONTEXT_TOKENS.observe(context_tokens)
+    return [
+        {"role": "system", "content": build_system_prompt(context_chunks)},
+        {"role": "user", "content": user_question},
+    ]
+
+REWRITE_PROMPT = (
+    "Rewrite the user's last message as a standalone question about Made with Nestlé Canada "
+    "products, recipes or articles, resolving pronouns and references from the conversation. "
+    "If it already stands alone, return it unchanged. Reply with the question only."
+)
+
+# Only questions that look like follow-ups pay for a rewrite call: very short
+# ones (at most REWRITE_SHORT_WORDS words), ones with pronouns or references
+# to earlier turns, and ones that open like a continuation ("what about ...").
+REWRITE_SHORT_WORDS = int(os.getenv("REWRITE_SHORT_WORDS", "3"))
+FOLLOW_UP = re.compile(
+    r"\b(?:it|its|they|them|their|theirs|this|that|these|those|one|ones|he|she|him|her|"
+    r"same|other|another|else|instead|former|latter|above|previous|again|also|too)\b|"
+    r"^\s*(?:and|or|but|so|then|what about|how about)\b",
+    re.I,
+)
+
+def looks_like_follow_up(question):
+    return len(question.split()) <= REWRITE_SHORT_WORDS or bool(FOLLOW_UP.search(question))
+
+def format_history(session):
+    lines = [f"Earlier: {session['summary']}"] if session["summary"] else []
+    for turn in session["turns"]:
+        lines.append(f"User: {turn['question']}\nAssistant: {turn['answer']}")
+    return "\n".join(lines)
+
+async def rewrite_question(user_question, session):
+    """
+    Turn a follow-up ("what about the dark one?") into a standalone question
+    using the session history, so retrieval and caching see the full intent.
+    Returns the question unchanged when there is no history, when it doesn't
+    look like a follow-up, or on failure.
+    """
+    if not session["turns"] and not session["summary"]:
+        return user_question
+    if not looks_like_follow_up(user_question):
+        return user_question
+    messages = [
+        {"role": "system", "content": REWRITE_PROMPT},
+        {"role": "user", "content": f"Conversation:\n{format_history(session)}\n\nLast message: {user_question}"},
+    ]
+    try:
+        with STAGE_SECONDS.time(stage="rewrite"):
+            response = await get_client().chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0,
+                max_tokens=80
+            )
+        record_usage(response.usage)
+        return response.choices[0].message.content.strip() or user_question
+    except Exception as e:
+        ERRORS.inc(stage="rewrite")
+        log(f"Question rewrite failed, using it as asked: {e}")
+        return user_question
+
+def embed_texts(texts):
+    response = openai.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+    return [item.embedding for item in response.data]
+
+async def embed_question_async(text):
+    response = await get_client().embeddings.create(model=EMBEDDING_MODEL, input=text)
+    return response.data[0].embedding
+
+def ask_openai_with_context(user_question, context_chunks):
     try:
         response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_question},
-            ],
+            model=CHAT_MODEL,
+            messages=build_messages(user_question, context_chunks),
             temperature=0.3,
             max_tokens=512
         )
         return response.choices[0].message.content.strip()
     except Exception as e:
         return f"Error: {str(e)}"
+
+def record_usage(usage):
+    if usage is not None:
+        LLM_TOKENS.inc(usage.prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(usage.completion_tokens, kind="completion")
+
+async def ask_openai_with_context_async(user_question, context_chunks):
+    # Same as ask_openai_with_context, but awaits the completion so the event
+    # loop keeps serving other requests while OpenAI generates the answer.
+    with STAGE_SECONDS.time(stage="prompt"):
+        messages = build_messages(user_question, context_chunks)
+    try:
+        with STAGE_SECONDS.time(stage="llm"):
+            response = await get_client().chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=512
+            )
+        record_usage(response.usage)
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        ERRORS.inc(stage="llm")
+        return f"Error: {str(e)}"
+
+async def stream_openai_with_context(user_question, context_chunks):
+    """Yield the answer incrementally as OpenAI generates it."""
+    with STAGE_SECONDS.time(stage="prompt"):
+        messages = build_messages(user_question, context_chunks)
+    try:
+        with STAGE_SECONDS.time(stage="llm"):
+            stream = await get_client().chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=512,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                # The final chunk carries usage only, with no choices.
+                record_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+    except Exception:
+        ERRORS.inc(stage="llm")
+        raise
@@ -0,0 +1,141 @@
+import json
+import os
+from pathlib import Path
+import numpy as np
+from .chunking import chunk_document, document_id
+from .corpus import DATA_DIR, iter_records
+from .llm import EMBEDDING_MODEL, embed_texts
+
+LOCAL_INDEX_DIR = Path(os.getenv("LOCAL_INDEX_DIR", DATA_DIR / "local_index"))
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.json"
+EMBED_BATCH_SIZE = 64
+
+class LocalIndex:
+    """
+    Exported corpus held in process: a (n_docs, dim) float32 matrix of
+    unit-length embeddings plus the matching records. The matrix is
+    memory-mapped read-only, so every worker on the host shares the same
+    page-cache copy.
+    """
+
+    def __init__(self, vectors, records):
+        self.vectors = vectors
+        self.records = records
+        self.types = np.array([record.get("type", "") for record in records])
+        self.positions = {record.get("id", record.get("url", "")): i for i, record in enumerate(records)}
+
+    @classmethod
+    def load(cls, index_dir=LOCAL_INDEX_DIR):
+        index_dir = Path(index_dir)
+        vectors = np.load(index_dir / VECTORS_FILE, mmap_mode="r")
+        with open(index_dir / RECORDS_FILE, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        if len(records) != vectors.shape[0]:
+            raise ValueError(f"{index_dir}: {len(records)} records but {vectors.shape[0]} vectors")
+        return cls(vectors, records)
+
+    def search_vector(self, vector, top_k=5, types=None):
+        """Return [(position, cosine score)] of the top_k rows (of the given types), best first."""
+        return self.search_vectors([vector], top_k, [types])[0]
+
+    def search_vectors(self, vectors, top_k=5, types=None):
+        """Batched search_vector: one matrix product for all query vectors."""
+        queries = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+        scores = queries @ self.vectors.T
+        for row, allowed in enumerate(types or []):
+            if allowed:
+                scores[row, ~np.isin(self.types, allowed)] = -np.inf
+        top_k = min(top_k, scores.shape[1])
+        if top_k <= 0:
+            return [[] for _ in range(len(queries))]
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        results = []
+        for row, candidates in zip(scores, top):
+            candidates = candidates[np.argsort(-row[candidates])]
+            results.append([(int(i), float(row[i])) for i in candidates if np.isfinite(row[i])])
+        return results
+
+class LocalRetriever:
+    name = "local"
+    # search_many embeds a whole batch in one request and scores it with one
+    # matrix product.
+    batched = True
+    # search() can reuse an embedding the caller already computed.
+    uses_question_vector = True
+
+    def __init__(self, index_dir=LOCAL_INDEX_DIR):
+        self.index_dir = index_dir
+        self.index = None
+
+    def warm(self):
+        if self.index is None:
+            self.index = LocalIndex.load(self.index_dir)
+
+    def close(self):
+        self.index = None
+
+    def search(self, question, top_k=5, types=None, vector=None):
+        # `vector` is the question's embedding when the caller already has
+        # it (the answer cache embeds every question), saving a second call.
+        if vector is None:
+            return self.search_many([question], top_k, [types])[0]
+        self.warm()
+        return [self._to_chunk(position, score) for position, score in self.index.search_vector(vector, top_k, types)]
+
+    def search_many(self, questions, top_k=5, types=None):
+        # One embedding request and one matrix product for the whole batch.
+        self.warm()
+        vectors = embed_texts(questions)
+        return [
+            [self._to_chunk(position, score) for position, score in hits]
+            for hits in self.index.search_vectors(vectors, top_k, types)
+        ]
+
+    def vectors(self, ids):
+        self.warm()
+        positions = self.index.positions
+        return {chunk_id: self.index.vectors[positions[chunk_id]] for chunk_id in ids if chunk_id in positions}
+
+    def _to_chunk(self, position, score):
+        record = self.index.records[position]
+        return {
+            "id": record.get("id", record.get("url", "")),
+            "title": record.get("title", ""),
+            "url": record.get("url", ""),
+            "type": record.get("type", ""),
+            "content": record["content"],
+            "score": score
+        }
+
+def export_local_index(index_dir=LOCAL_INDEX_DIR):
+    """Chunk and embed the scraped pages with EMBEDDING_MODEL and write the local index files."""
+    records = []
+    for doc in iter_records():
+        if not doc.get("content", "").strip():
+            continue
+        for chunk in chunk_document(doc, document_id(doc)):
+            records.append({key: chunk[key] for key in ("id", "parent_id", "section", "title", "url", "type", "content")})
+
+    vectors = np.zeros((len(records), 0), dtype=np.float32)
+    for batch_start in range(0, len(records), EMBED_BATCH_SIZE):
+        batch = records[batch_start: batch_start + EMBED_BATCH_SIZE]
+        embedded = np.asarray(embed_texts([r["content"] for r in batch]), dtype=np.float32)
+        if vectors.shape[1] == 0:
+            vectors = np.zeros((len(records), embedded.shape[1]), dtype=np.float32)
+        vectors[batch_start: batch_start + len(batch)] = embedded
+        print(f"Embedded {batch_start + len(batch)}/{len(records)}")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1.0, norms)
+
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    np.save(index_dir / VECTORS_FILE, vectors)
+    with open(index_dir / RECORDS_FILE, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False)
+    print(f"Saved {len(records)} vectors ({EMBEDDING_MODEL}) to {index_dir.resolve()}")
+
+if __name__ == "__main__":
+    export_local_index()
@@ -1,10 +1,60 @@
-from fastapi import FastAPI
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import Optional
 from pydantic import BaseModel
-from .vector_search import query_pinecone
-from .llm import ask_openai_with_context
+from . import knowledge_graph, llm, vector_search
+from .cache import SemanticCache, normalize_question
+from .coalesce import SingleFlight
+from .context_packer import get_encoding
+from .request_log import REQUEST_ID, log
+from .metrics import CallbackCounter, GRAPH_ANSWERS, HTTP_REQUEST_SECONDS, NOT_FOUND, STAGE_SECONDS, render
+from .sessions import add_turn, create_session_store, new_session
+from .vector_search import retrieve_async, retrieve_many_async
+from .llm import (
+    NOT_FOUND_REPLY, ask_openai_with_context_async, embed_question_async, rewrite_question, stream_openai_with_context
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the upstream clients once per worker and open their connections
+    # before the first request arrives; a failed warm-up is not fatal.
+    # Blocking calls (Pinecone searches and vector fetches, BM25, warm-ups)
+    # run in the default executor. Give it one thread per Pinecone connection
+    # so in-flight retrievals are bounded by the connection pool, not by
+    # asyncio's default of min(32, CPUs + 4) threads.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=vector_search.PINECONE_POOL_SIZE)
+    )
+    startup = REQUEST_ID.set("startup")
+    retriever = vector_search.get_retriever()
+    llm.init_client()
+    results = await asyncio.gather(
+        asyncio.to_thread(retriever.warm),
+        llm.warm_client(),
+        asyncio.to_thread(get_encoding),
+        asyncio.to_thread(vector_search.init_lexical_index),
+        asyncio.to_thread(knowledge_graph.init_graph),
+        return_exceptions=True,
+    )
+    names = (f"Retriever ({retriever.name})", "OpenAI", "Tokenizer", "BM25 index", "Knowledge graph")
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            log(f"{name} warm-up failed: {result}")
+    REQUEST_ID.reset(startup)
+    yield
+    await llm.close_client()
+    await session_store.close()
+    retriever.close()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for the React frontend (adjust origin as needed)
 app.add_middleware(
@@ -16,20 +66,245 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    # Reuse the caller's request id (e.g. from a proxy) or mint one, echo it
+    # back and prefix every log line written while handling the request.
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = REQUEST_ID.set(request_id)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        REQUEST_ID.reset(token)
+    elapsed = time.perf_counter() - start
+    response.headers["X-Request-ID"] = request_id
+    # Label by route template so unknown URLs can't blow up the series count.
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        elapsed, method=request.method, path=route.path if route else "unmatched", status=response.status_code
+    )
+    print(f"[{request_id}] {request.method} {request.url.path} {response.status_code} {elapsed * 1000:.1f}ms")
+    return response
+
+# Limits for /chat/batch: questions per request and concurrent LLM calls.
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
 class ChatRequest(BaseModel):
     question: str
+    # Optional conversation id; follow-ups in the same session are rewritten
+    # into standalone questions using the earlier turns.
+    session_id: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    questions: list[str]
+
+answer_cache = SemanticCache()
+inflight_answers = SingleFlight()
+session_store = create_session_store()
+
+CallbackCounter(
+    "cache_requests_total", "Cache lookups, by cache and result.", ["cache", "result"],
+    lambda: {
+        ("answer", "hit"): answer_cache.hits,
+        ("answer", "miss"): answer_cache.misses,
+        ("retrieval", "hit"): vector_search.retrieval_cache.hits,
+        ("retrieval", "miss"): vector_search.retrieval_cache.misses,
+    },
+)
+CallbackCounter(
+    "coalesced_requests_total", "Calls served by an identical in-flight call.", ["layer"],
+    lambda: {
+        ("answer",): inflight_answers.coalesced,
+        ("retrieval",): vector_search.inflight_searches.coalesced,
+    },
+)
+
+async def lookup_cached_answer(user_question):
+    """Return (cache_key, embedding, cached) for a question; cached is None on a miss."""
+    key = normalize_question(user_question)
+    try:
+        vector = await embed_question_async(key)
+    except Exception as e:
+        log(f"Question embedding failed, skipping answer cache: {e}")
+        return key, None, None
+    return key, vector, answer_cache.get(key, vector)
+
+async def lookup_and_retrieve(user_question):
+    """
+    Return (cache_key, embedding, cached, context_chunks); context_chunks is
+    None on a cache hit. Retrievers that embed the question themselves
+    (Pinecone) search while the answer cache is checked, and the search
+    result is dropped on a hit. The local index waits for the cache lookup's
+    embedding so it doesn't embed the question twice.
+    """
+    if vector_search.get_retriever().uses_question_vector:
+        key, vector, cached = await lookup_cached_answer(user_question)
+        if cached is not None:
+            return key, vector, cached, None
+        return key, vector, None, await retrieve_async(user_question, vector=vector)
+    retrieval = asyncio.ensure_future(retrieve_async(user_question))
+    key, vector, cached = await lookup_cached_answer(user_question)
+    if cached is not None:
+        # Let the search finish (it still fills the retrieval cache), but
+        # don't wait for it; reading the exception keeps asyncio quiet.
+        retrieval.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return key, vector, cached, None
+    return key, vector, None, await retrieval
+
+def store_cached_answer(key, vector, answer, context_chunks):
+    if vector is None or answer.startswith("Error:"):
+        return
+    sources = [{"title": chunk["title"], "url": chunk["url"]} for chunk in context_chunks]
+    answer_cache.put(key, vector, {"answer": answer, "sources": sources})
+
+async def resolve_question(req):
+    """Return (standalone question, session); session is None without a session_id."""
+    if not req.session_id:
+        return req.question, None
+    session = await session_store.get(req.session_id) or new_session()
+    return await rewrite_question(req.question, session), session
+
+async def remember_turn(req, session, question, answer):
+    if session is None or answer.startswith("Error:"):
+        return
+    await session_store.put(req.session_id, add_turn(session, question, answer))
+
+def answer_from_graph(user_question):
+    """(answer, sources) for list/filter questions the knowledge graph can answer, else None."""
+    graph = knowledge_graph.get_graph()
+    if graph is None:
+        return None
+    result = knowledge_graph.answer_graph_question(graph, user_question)
+    if result is not None:
+        GRAPH_ANSWERS.inc()
+    return result
+
+async def answer_question(user_question):
+    # Step 1: Retrieve relevant context (Pinecone or the local index),
+    # unless the answer cache already has the answer
+    key, vector, cached, context_chunks = await lookup_and_retrieve(user_question)
+    if cached is not None:
+        return cached["answer"]
+    if not context_chunks:
+        # Nothing cleared the relevance cut-off: no need to ask the LLM.
+        NOT_FOUND.inc()
+        return NOT_FOUND_REPLY
+    # Step 2: Pass context and question to OpenAI LLM
+    answer = await ask_openai_with_context_async(user_question, context_chunks)
+    store_cached_answer(key, vector, answer, context_chunks)
+    return answer
 
 @app.post("/chat")
 async def chat_endpoint(req: ChatRequest):
-    user_question = req.question
-    # Step 1: Query Pinecone for relevant context
-    context_chunks = query_pinecone(user_question)
-    # Step 2: Pass context and question to OpenAI LLM
-    answer = ask_openai_with_context(user_question, context_chunks)
+    with STAGE_SECONDS.time(stage="total"):
+        user_question, session = await resolve_question(req)
+        graph_answer = answer_from_graph(user_question)
+        if graph_answer is not None:
+            # "Which products contain X?" style questions: exact lists from the graph.
+            answer = graph_answer[0]
+        else:
+            # Identical questions already being answered share that answer.
+            answer = await inflight_answers.do(
+                normalize_question(user_question), lambda: answer_question(user_question)
+            )
+    await remember_turn(req, session, user_question, answer)
     return {"answer": answer}
 
+@app.post("/chat/batch")
+async def chat_batch_endpoint(req: BatchChatRequest):
+    questions = req.questions
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+
+    # Step 1: Retrieve context for every question in batches
+    contexts = await retrieve_many_async(questions)
+
+    # Step 2: Answer with at most BATCH_LLM_CONCURRENCY completions in flight
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def answer(question, context_chunks):
+        if isinstance(context_chunks, Exception):
+            return {"question": question, "error": f"Retrieval failed: {str(context_chunks)}"}
+        if not context_chunks:
+            NOT_FOUND.inc()
+            return {"question": question, "answer": NOT_FOUND_REPLY}
+        async with semaphore:
+            answer = await ask_openai_with_context_async(question, context_chunks)
+        if answer.startswith("Error:"):
+            return {"question": question, "error": answer}
+        return {"question": question, "answer": answer}
+
+    results = await asyncio.gather(*(answer(q, c) for q, c in zip(questions, contexts)))
+    return {"results": results}
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest):
+
+    async def events():
+        # Sources go out as soon as retrieval finishes, then the answer
+        # follows token by token; "done" always closes the stream.
+        start = time.perf_counter()
+        try:
+            user_question, session = await resolve_question(req)
+            graph_answer = answer_from_graph(user_question)
+            if graph_answer is not None:
+                answer, items = graph_answer
+                yield sse_event("sources", items)
+                yield sse_event("token", {"text": answer})
+                await remember_turn(req, session, user_question, answer)
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage="total")
+                yield sse_event("done", {})
+                return
+            key, vector, cached, context_chunks = await lookup_and_retrieve(user_question)
+            if cached is not None:
+                yield sse_event("sources", cached["sources"])
+                yield sse_event("token", {"text": cached["answer"]})
+                await remember_turn(req, session, user_question, cached["answer"])
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage="total")
+                yield sse_event("done", {})
+                return
+            yield sse_event("sources", [
+                {"title": chunk["title"], "url": chunk["url"]} for chunk in context_chunks
+            ])
+            if not context_chunks:
+                NOT_FOUND.inc()
+                yield sse_event("token", {"text": NOT_FOUND_REPLY})
+                await remember_turn(req, session, user_question, NOT_FOUND_REPLY)
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage="total")
+                yield sse_event("done", {})
+                return
+            parts = []
+            async for text in stream_openai_with_context(user_question, context_chunks):
+                if not parts:
+                    STAGE_SECONDS.observe(time.perf_counter() - start, stage="first_token")
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+            answer = "".join(parts).strip()
+            store_cached_answer(key, vector, answer, context_chunks)
+            await remember_turn(req, session, user_question, answer)
+        except Exception as e:
+            yield sse_event("error", {"message": f"Error: {str(e)}"})
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="total")
+        yield sse_event("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("chatbot:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,121 @@
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from in-process cache hits up to slow completions.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+class Counter:
+    """Monotonic counter, optionally split by labels (Prometheus text format)."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # An unlabelled counter is exported as 0 before its first increment.
+        self._values = {} if self.labelnames else {(): 0}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name, key, value
+
+class CallbackCounter(Counter):
+    """Counter whose values are read from `fn() -> {label tuple: value}` at scrape time."""
+
+    def __init__(self, name, help, labelnames, fn):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def samples(self):
+        for values, value in self.fn().items():
+            yield self.name, tuple(zip(self.labelnames, values)), value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for key, series in self._series.items():
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket", key + (("le", repr(float(bound))),), count
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), series[-1]
+            yield f"{self.name}_sum", key, series[-2]
+            yield f"{self.name}_count", key, series[-1]
+
+def render():
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+# Metrics shared by the chat pipeline. Values are per worker process.
+STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Time spent in each chat pipeline stage (retrieval, prompt, llm, first_token, total).",
+    ["stage"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "HTTP request latency until response headers.", ["method", "path", "status"]
+)
+CONTEXT_TOKENS = Histogram(
+    "context_tokens", "Tokens of retrieved context packed into each prompt.",
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 8000),
+)
+LLM_TOKENS = Counter("llm_tokens_total", "OpenAI tokens used, by kind (prompt/completion).", ["kind"])
+NOT_FOUND = Counter("chat_not_found_total", "Questions answered 'not found' without an LLM call.")
+QUERY_ROUTES = Counter(
+    "retrieval_routes_total",
+    "Retrievals by routed content type ('unrouted', or 'fallback' when a filtered search came back empty).",
+    ["route"],
+)
+GRAPH_ANSWERS = Counter("chat_graph_answers_total", "Questions answered from the knowledge graph without an LLM call.")
+ERRORS = Counter("chat_errors_total", "Failures in the chat pipeline, by stage.", ["stage"])
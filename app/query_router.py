@@ -0,0 +1,46 @@
+import os
+import re
+
+# Minimum share of the keyword evidence the chosen types must hold before a
+# question is routed; below it (or with no evidence) the search is unfiltered.
+ROUTING_MIN_CONFIDENCE = float(os.getenv("ROUTING_MIN_CONFIDENCE", "0.6"))
+
+# Cue words per record `type` (singular and plural stems are both listed).
+TYPE_KEYWORDS = {
+    "product": {
+        "product", "products", "nutrition", "nutritional", "calorie", "calories", "kcal",
+        "protein", "sugar", "sodium", "fat", "fibre", "fiber", "allergen", "allergens",
+        "ingredient", "ingredients", "contain", "contains", "gluten", "serving", "size",
+        "pack", "package", "buy", "price", "flavour", "flavours", "flavor", "flavors",
+        "brand", "brands", "bar", "bars", "cereal", "coffee", "capsule", "capsules",
+    },
+    "recipe": {
+        "recipe", "recipes", "cook", "cooking", "bake", "baking", "make", "prepare",
+        "preparation", "dish", "dishes", "meal", "meals", "dessert", "desserts",
+        "breakfast", "lunch", "dinner", "snack", "minutes", "oven", "cake", "cookies",
+        "muffins", "smoothie", "servings",
+    },
+    "article": {
+        "article", "articles", "tip", "tips", "advice", "guide", "why", "benefits",
+        "healthy", "health", "wellness", "diet", "eating", "habits", "kids", "children",
+        "sustainability", "sustainable", "history", "story", "news", "learn",
+    },
+}
+
+def classify_question(question, min_confidence=ROUTING_MIN_CONFIDENCE):
+    """
+    Return the content types a question is most likely about, or None when
+    the keyword evidence is missing or too evenly spread to trust.
+    """
+    words = re.findall(r"\w+", question.lower())
+    scores = {t: sum(word in keywords for word in words) for t, keywords in TYPE_KEYWORDS.items()}
+    total = sum(scores.values())
+    if total == 0:
+        return None
+    best = max(scores.values())
+    types = sorted(t for t, score in scores.items() if score * 2 >= best)
+    if len(types) == len(TYPE_KEYWORDS):
+        return None
+    if sum(scores[t] for t in types) / total < min_confidence:
+        return None
+    return types
@@ -0,0 +1,10 @@
+import contextvars
+
+# Id of the HTTP request being handled, set by main's middleware. asyncio
+# tasks and asyncio.to_thread calls started while handling it inherit it.
+REQUEST_ID = contextvars.ContextVar("request_id", default=None)
+
+def log(message):
+    """print() prefixed with the current request id, when there is one."""
+    request_id = REQUEST_ID.get()
+    print(f"[{request_id}] {message}" if request_id else message)
@@ -0,0 +1,38 @@
+import os
+import numpy as np
+
+# Maximal marginal relevance: 1.0 ranks purely by relevance, lower values
+# trade relevance for novelty against the hits already picked.
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Candidates at least this similar to a picked hit are dropped as duplicates.
+MMR_DUPLICATE_SIMILARITY = float(os.getenv("MMR_DUPLICATE_SIMILARITY", "0.95"))
+
+def mmr(relevance, vectors, top_k=5, lambda_=MMR_LAMBDA, duplicate_similarity=MMR_DUPLICATE_SIMILARITY):
+    """
+    Greedy MMR selection. Returns the indices of at most top_k candidates in
+    pick order. vectors is (n, dim); rows need not be normalised.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    n = len(relevance)
+    if n == 0 or top_k <= 0:
+        return []
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+    similarity = vectors @ vectors.T
+
+    picked = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything picked so far.
+    redundancy = similarity[picked[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[picked[0]] = False
+    while len(picked) < top_k:
+        available &= redundancy < duplicate_similarity
+        if not available.any():
+            break
+        gain = np.where(available, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(gain))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return picked
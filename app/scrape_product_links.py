@@ -5,15 +5,22 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
 import selenium.common.exceptions
+import argparse
+import asyncio
 import time
 import json
-from pathlib import Path
+from bs4 import BeautifulSoup
 
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import selenium.common.exceptions as se
+from .corpus import DATA_DIR
+from .http_fetch import HTTP_CONCURRENCY, crawl_listing, create_client
 
 BASE_URL = "https://www.madewithnestle.ca"
+OUTPUT_PATH = DATA_DIR / "brand_products.json"
+# Listing pages requested at once per brand when discovering over HTTP.
+PAGE_WINDOW = 4
 
 def dismiss_cookies(driver):
     try:
@@ -243,35 +250,82 @@ def get_product_links_from_brand(driver, brand_url):
     print(f"[{brand_url}] – total products: {len(links)}")
     return {"brand_url": brand_url, "products": sorted(links)}
 
+def product_links_from_html(html, brand_url):
+    """Product links in the brand page's #products grid (same rules as the browser path)."""
+    container = BeautifulSoup(html, "html.parser").find(id="products")
+    if container is None:
+        return set()
+    root = brand_url.rstrip("/")
+    links = set()
+    for a in container.find_all("a", href=True):
+        href = norm(a["href"])
+        if href.startswith(BASE_URL) and href.rstrip("/") != root:
+            links.add(href)
+    return links
 
+async def discover_products_http(brand_urls, concurrency=HTTP_CONCURRENCY):
+    """
+    {brand url: product links} from each brand's `?page=N` pages fetched
+    directly, several brands at a time; None for brands that need the browser.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency // PAGE_WINDOW))
 
-options = Options()
-options.add_argument("--headless")
-options.add_argument("--disable-gpu")
-options.add_argument("--window-size=1920,1080")
-options.add_argument("user-agent=Mozilla/5.0")
-driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-driver.get(BASE_URL)
-dismiss_cookies(driver)
+    async def crawl(client, brand_url):
+        async with semaphore:
+            return await crawl_listing(
+                client, brand_url, lambda html: product_links_from_html(html, brand_url), window=PAGE_WINDOW
+            )
 
-brand_links = get_all_brand_links(driver)
-print(f"Total unique brands: {len(brand_links)}")
+    async with create_client(concurrency) as client:
+        found = await asyncio.gather(*(crawl(client, url) for url in brand_urls))
+    return dict(zip(brand_urls, found))
+
+def create_driver():
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("user-agent=Mozilla/5.0")
+    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect product URLs for every brand.")
+    parser.add_argument("--browser-only", action="store_true", help="click through every brand grid in Chrome")
+    args = parser.parse_args()
+
+    # The brand list comes from hover menus, so it is always read in Chrome.
+    driver = create_driver()
+    driver.get(BASE_URL)
+    dismiss_cookies(driver)
+
+    brand_links = get_all_brand_links(driver)
+    print(f"Total unique brands: {len(brand_links)}")
+
+    internal = [brand["url"] for brand in brand_links if brand["url"].startswith(BASE_URL)]
+    found = {} if args.browser_only else asyncio.run(discover_products_http(internal))
+
+    # loop over all brand dictionaries you already collected
+    all_brand_data = []
+    for brand in brand_links:
+        products = found.get(brand["url"])
+        if products is not None:
+            data = {"brand_url": brand["url"], "products": sorted(products)}
+            print(f"[{brand['url']}] – total products: {len(products)} (HTTP)")
+        else:
+            # Not reachable via ?page=N (or external): expand the grid in the browser.
+            data = get_product_links_from_brand(driver, brand["url"])
+        all_brand_data.append(data)
+        print(data)
 
-# loop over all brand dictionaries you already collected
-all_brand_data = []
-for brand in brand_links:
-    data = get_product_links_from_brand(driver, brand["url"])
-    all_brand_data.append(data)
-    print(data)
+    driver.quit()
 
-driver.quit()
+    # ── NEW: persist to a file ────────────────
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-# ── NEW: persist to a file ────────────────
-out_dir  = Path("../data/raw_pages")
-out_dir.mkdir(exist_ok=True)            # create ./data if it doesn’t exist
-out_file = out_dir / "brand_products.json"
+    with OUTPUT_PATH.open("w", encoding="utf-8") as f:
+        json.dump(all_brand_data, f, ensure_ascii=False, indent=2)
 
-with out_file.open("w", encoding="utf‑8") as f:
-    json.dump(all_brand_data, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved {len(all_brand_data)} brand records → {OUTPUT_PATH.resolve()}")
 
-print(f"\nSaved {len(all_brand_data)} brand records → {out_file.resolve()}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -6,13 +6,17 @@ from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
 from bs4 import BeautifulSoup
 import selenium.common.exceptions
+import argparse
+import asyncio
 import json
 import time
-from pathlib import Path
+from .corpus import DATA_DIR
+from .http_fetch import HTTP_CONCURRENCY, crawl_listing, create_client
 
 BASE_URL = "https://www.madewithnestle.ca"
 RECIPE_START_URL = f"{BASE_URL}/recipes"
 ARTICLE_START_URL = f"{BASE_URL}/articles"
+OUTPUT_PATH = DATA_DIR / "recipes_articles_urls.json"
 
 def dismiss_cookies(driver):
     # Try common OneTrust button selectors
@@ -191,12 +195,8 @@ def load_all_items_with_more_button_articles(driver, max_clicks=100):
             print(f"No More button found or not clickable (articles): {e}")
             break
 
-def get_recipe_links(driver):
-    # Go to the recipe page and load all recipes
-    driver.get(RECIPE_START_URL)
-    dismiss_cookies(driver)
-    load_all_items_with_more_button(driver)
-    soup = BeautifulSoup(driver.page_source, "html.parser")
+def recipe_links_from_html(html):
+    soup = BeautifulSoup(html, "html.parser")
     links = set()
     for a in soup.find_all("a", href=True):
         href = a["href"]
@@ -205,10 +205,10 @@ def get_recipe_links(driver):
             links.add(href)
         elif href.startswith(BASE_URL + "/recipe/"):
             links.add(href)
-    return list(links)
+    return links
 
-def get_article_links(driver):
-    soup = BeautifulSoup(driver.page_source, "html.parser")
+def article_links_from_html(html):
+    soup = BeautifulSoup(html, "html.parser")
     links = set()
     for a in soup.find_all("a", href=True):
         href = a["href"]
@@ -216,50 +216,81 @@ def get_article_links(driver):
             if href.startswith("/"):
                 href = BASE_URL + href
             links.add(href)
-    return list(links)
+    return links
 
+def get_recipe_links(driver):
+    # Go to the recipe page and load all recipes
+    driver.get(RECIPE_START_URL)
+    dismiss_cookies(driver)
+    load_all_items_with_more_button(driver)
+    return list(recipe_links_from_html(driver.page_source))
 
-def main():
+def get_article_links(driver):
+    return list(article_links_from_html(driver.page_source))
+
+async def discover_links_http(concurrency=HTTP_CONCURRENCY):
+    """
+    (recipe links, article links) from the listings' `?page=N` pages fetched
+    directly; either is None when its listing can't be read that way.
+    """
+    async with create_client(concurrency) as client:
+        return await asyncio.gather(
+            crawl_listing(client, RECIPE_START_URL, recipe_links_from_html, window=concurrency // 2 or 1),
+            crawl_listing(client, ARTICLE_START_URL, article_links_from_html, window=concurrency // 2 or 1),
+        )
+
+def create_driver():
     options = Options()
     options.add_argument("--headless")
     options.add_argument("--disable-gpu")
     options.add_argument("--window-size=1920,1080")
     options.add_argument("user-agent=Mozilla/5.0")
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
 
-    # --- Recipes ---
-    print("Loading recipes page and dismissing cookies...")
-    driver.get(RECIPE_START_URL)
-    dismiss_cookies(driver)
-    load_all_items_with_more_button(driver)
-    recipe_links = get_recipe_links(driver)
-    print(f"Found {len(recipe_links)} recipes")
 
-    # --- Articles ---
-    print("Loading articles page and dismissing cookies...")
-    driver.get(ARTICLE_START_URL)
-    dismiss_cookies(driver)
-    load_all_items_with_more_button_articles(driver)
-    article_links = get_article_links(driver)
+def main():
+    parser = argparse.ArgumentParser(description="Collect recipe and article URLs.")
+    parser.add_argument("--browser-only", action="store_true", help="click through the listings in Chrome")
+    args = parser.parse_args()
+
+    recipe_links = article_links = None
+    if not args.browser_only:
+        # Fast path: request the listing pages directly and concurrently.
+        found = asyncio.run(discover_links_http())
+        recipe_links, article_links = (sorted(links) if links else None for links in found)
+
+    if recipe_links is None or article_links is None:
+        driver = create_driver()
+
+        # --- Recipes ---
+        if recipe_links is None:
+            print("Loading recipes page and dismissing cookies...")
+            recipe_links = get_recipe_links(driver)
+
+        # --- Articles ---
+        if article_links is None:
+            print("Loading articles page and dismissing cookies...")
+            driver.get(ARTICLE_START_URL)
+            dismiss_cookies(driver)
+            load_all_items_with_more_button_articles(driver)
+            article_links = get_article_links(driver)
+
+        driver.quit()
+    print(f"Found {len(recipe_links)} recipes")
     print(f"Found {len(article_links)} articles")
 
-
-    driver.quit()
-
     # Save to a file for later scraping
-    out_dir = Path("../data/raw_pages")
-    out_dir.mkdir(exist_ok=True)
-    out_file = out_dir / "recipes_articles_urls.json"
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 
     urls_data = {
         "recipes": recipe_links,
         "articles": article_links
     }
 
-    with out_file.open("w", encoding="utf-8") as f:
+    with OUTPUT_PATH.open("w", encoding="utf-8") as f:
         json.dump(urls_data, f, ensure_ascii=False, indent=2)
 
-    print(f"Saved URLs for {len(recipe_links)} recipes and {len(article_links)} articles → {out_file.resolve()}")
+    print(f"Saved URLs for {len(recipe_links)} recipes and {len(article_links)} articles → {OUTPUT_PATH.resolve()}")
 
 
 if __name__ == "__main__":
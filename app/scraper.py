@@ -4,19 +4,34 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
+import argparse
+import asyncio
 import json
+import os
+import threading
 import time
-from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import selenium.common.exceptions as se
+from .corpus import DATA_DIR, PROCESSED_JSONL_PATH, RecordWriter, next_changes_path
+from .crawl_state import CrawlState
+from .http_fetch import HTTP_CONCURRENCY, fetch_pages
 
 # Paths to your saved url lists
-REC_ART_URLS_PATH = "../data/raw_pages/recipes_articles_urls.json"
-BRAND_PROD_URLS_PATH = "../data/raw_pages/brand_products.json"
-OUTPUT_PATH = "../data/raw_pages/processed.json"
+REC_ART_URLS_PATH = DATA_DIR / "recipes_articles_urls.json"
+BRAND_PROD_URLS_PATH = DATA_DIR / "brand_products.json"
+# Records are appended as each page finishes (see corpus.RecordWriter)
+OUTPUT_PATH = PROCESSED_JSONL_PATH
 
 BASE_URL = "https://www.madewithnestle.ca"
+# Headless Chrome instances scraping pages in parallel (one per thread).
+SCRAPER_WORKERS = int(os.getenv("SCRAPER_WORKERS", "4"))
+# A page missing from the link lists is only reported as deleted after this
+# many runs in a row, and no page is when more than this fraction of the known
+# pages went missing at once (most likely a truncated link list).
+REMOVE_AFTER_RUNS = int(os.getenv("SCRAPER_REMOVE_AFTER_RUNS", "2"))
+MAX_REMOVED_FRACTION = float(os.getenv("SCRAPER_MAX_REMOVED_FRACTION", "0.2"))
 
 def dismiss_cookies(driver):
     try:
@@ -41,7 +56,10 @@ def extract_recipe_content(driver, url):
     driver.get(url)
     dismiss_cookies(driver)
     time.sleep(3)
-    soup = BeautifulSoup(driver.page_source, "html.parser")
+    return parse_recipe_html(url, driver.page_source)
+
+def parse_recipe_html(url, html):
+    soup = BeautifulSoup(html, "html.parser")
     title = soup.find("h1").text.strip() if soup.find("h1") else ""
 
     description = ""
@@ -103,7 +121,10 @@ def extract_article_content(driver, url):
     driver.get(url)
     dismiss_cookies(driver)
     time.sleep(2)
-    soup = BeautifulSoup(driver.page_source, "html.parser")
+    return parse_article_html(url, driver.page_source)
+
+def parse_article_html(url, html):
+    soup = BeautifulSoup(html, "html.parser")
     title = soup.find("h1").text.strip() if soup.find("h1") else ""
     content_div = soup.find("div", class_="coh-container coh-ce-0c411d4b")
     if not content_div:
@@ -277,63 +298,243 @@ def extract_product_content(driver, url):
     result["content"] = "\n\n".join(content_parts)
     return result
 
-def main():
+def create_driver():
     options = Options()
     options.add_argument("--headless")
     options.add_argument("--disable-gpu")
     options.add_argument("--window-size=1920,1080")
     options.add_argument("user-agent=Mozilla/5.0")
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+
+class DriverPool:
+    """
+    One Chrome per worker thread, created on the thread's first page and
+    reused for every page after it. A browser that dies is replaced on the
+    next page; close() quits them all.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._drivers = []
+
+    def get(self):
+        driver = getattr(self._local, "driver", None)
+        if driver is None:
+            driver = self._local.driver = create_driver()
+            with self._lock:
+                self._drivers.append(driver)
+        return driver
+
+    def discard(self):
+        driver = getattr(self._local, "driver", None)
+        self._local.driver = None
+        if driver is not None:
+            with self._lock:
+                self._drivers.remove(driver)
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def close(self):
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+EXTRACTORS = {
+    "product": extract_product_content,
+    "recipe": extract_recipe_content,
+    "article": extract_article_content,
+}
+
+# Pages whose server-rendered HTML has everything the parser needs; they are
+# fetched over plain HTTP first and only rendered in Chrome when incomplete.
+HTML_PARSERS = {
+    "recipe": parse_recipe_html,
+    "article": parse_article_html,
+}
+
+def is_complete(record):
+    if not record["title"] or not record["content"]:
+        return False
+    return record["type"] != "recipe" or "Ingredients:" in record["content"]
+
+async def prefetch(jobs, validators, futures, concurrency=HTTP_CONCURRENCY):
+    """
+    Conditionally GET every page, resolving futures[url] with its page (see
+    http_fetch.fetch_page) as soon as that response is in. Recipe and article
+    pages that parse completely get a "record"; product pages are fetched
+    only for their validators and a possible 304.
+    """
+    kinds = {url: kind for kind, url in jobs}
+    counts = {"not modified": 0, "parsed": 0}
+
+    def resolve(url, page):
+        if page is not None and page["status"] == 304:
+            counts["not modified"] += 1
+        elif page is not None and kinds[url] in HTML_PARSERS:
+            try:
+                record = HTML_PARSERS[kinds[url]](url, page["text"])
+            except Exception as e:
+                print(f"[{url}] Could not parse fetched HTML: {e}")
+            else:
+                if is_complete(record):
+                    page["record"] = record
+                    counts["parsed"] += 1
+        if page is not None:
+            page["text"] = None  # the HTML isn't needed any more
+        futures[url].set_result(page)
 
-    # Load url lists
+    await fetch_pages(list(kinds), validators, concurrency, on_page=resolve)
+    print(f"HTTP: {counts['not modified']} pages not modified, {counts['parsed']} recipe and article pages parsed")
+
+# WebDriver errors about the page rather than the browser.
+PAGE_ERRORS = (se.TimeoutException, se.NoSuchElementException, se.StaleElementReferenceException)
+
+def load_jobs():
+    """[(type, url)] for every page to scrape: products, then recipes, then articles, each URL once."""
     with open(REC_ART_URLS_PATH, "r", encoding="utf-8") as f:
         url_data = json.load(f)
     with open(BRAND_PROD_URLS_PATH, "r", encoding="utf-8") as f:
         brand_products = json.load(f)
 
-    recipe_urls = url_data.get("recipes", [])
-    article_urls = url_data.get("articles", [])
-    product_urls = []
+    jobs = {}
     for entry in brand_products:
-        product_urls.extend(entry.get("products", []))
-    product_urls = list(set(product_urls))  # deduplicate
-
-    all_data = []
-
-    # Scrape products
-    for i, url in enumerate(product_urls):
-        print(f"[Product {i+1}/{len(product_urls)}] {url}")
-        try:
-            product = extract_product_content(driver, url)
-            print(product)
-            all_data.append(product)
-        except Exception as e:
-            print(f"Failed to scrape product {url}: {e}")
+        for url in entry.get("products", []):
+            jobs.setdefault(url, "product")
+    for url in url_data.get("recipes", []):
+        jobs.setdefault(url, "recipe")
+    for url in url_data.get("articles", []):
+        jobs.setdefault(url, "article")
+    return [(kind, url) for url, kind in jobs.items()]
 
-    # Scrape recipes
-    for i, url in enumerate(recipe_urls):
-        print(f"[Recipe {i+1}/{len(recipe_urls)}] {url}")
+def main():
+    parser = argparse.ArgumentParser(description="Scrape product, recipe and article pages.")
+    parser.add_argument("--workers", type=int, default=SCRAPER_WORKERS, help="browsers scraping in parallel")
+    parser.add_argument("--http-concurrency", type=int, default=HTTP_CONCURRENCY,
+                        help="parallel plain-HTTP requests")
+    parser.add_argument("--browser-only", action="store_true", help="render every page in Chrome")
+    parser.add_argument("--recrawl", action="store_true",
+                        help="ignore stored ETag/Last-Modified and fetch every page again")
+    parser.add_argument("--allow-removals", action="store_true",
+                        help=f"remove missing pages even if more than {MAX_REMOVED_FRACTION:.0%} of them are gone")
+    args = parser.parse_args()
+
+    jobs = load_jobs()
+    state = CrawlState()
+    known = state.urls()
+    pool = DriverPool()
+    # Pages are requested over HTTP in the background (conditionally, when an
+    # earlier run stored validators), in job order. Each job waits only for
+    # its own response, so the browsers start as soon as the first products'
+    # answers are in.
+    fetcher = ThreadPoolExecutor(max_workers=1)
+    futures = {} if args.browser_only else {url: Future() for kind, url in jobs}
+    validators = {} if args.recrawl else state.validators()
+
+    def fetch():
         try:
-            all_data.append(extract_recipe_content(driver, url))
+            asyncio.run(prefetch(jobs, validators, futures, max(1, args.http_concurrency)))
         except Exception as e:
-            print(f"Failed to scrape recipe {url}: {e}")
-
-    # Scrape articles
-    for i, url in enumerate(article_urls):
-        print(f"[Article {i+1}/{len(article_urls)}] {url}")
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+
+    if futures:
+        fetcher.submit(fetch)
+
+    def scrape(numbered_job):
+        """(record or None, HTTP page or None) for one job; a 304 page comes back without a record."""
+        i, (kind, url) = numbered_job
+        page = None
+        if futures:
+            try:
+                page = futures[url].result()
+            except Exception as e:
+                print(f"HTTP fetching failed, using the browser: {e}")
+        if page is not None and (page["status"] == 304 or "record" in page):
+            return page.get("record"), page
+        print(f"[{kind.capitalize()} {i + 1}/{len(jobs)}] {url}")
+        return render(kind, url), page
+
+    def render(kind, url):
         try:
-            all_data.append(extract_article_content(driver, url))
+            return EXTRACTORS[kind](pool.get(), url)
+        except PAGE_ERRORS as e:
+            print(f"Failed to scrape {kind} {url}: {e}")
+        except se.WebDriverException as e:
+            # Anything else from WebDriver may mean the browser is gone;
+            # start a fresh one for the next page.
+            print(f"Failed to scrape {kind} {url}: {e}")
+            pool.discard()
         except Exception as e:
-            print(f"Failed to scrape article {url}: {e}")
-
-    driver.quit()
-
-    # Save all data
-    out_path = Path(OUTPUT_PATH)
-    out_path.parent.mkdir(exist_ok=True)
-    with out_path.open("w", encoding="utf-8") as f:
-        json.dump(all_data, f, ensure_ascii=False, indent=2)
-    print(f"\nSaved {len(all_data)} records to {out_path.resolve()}")
+            print(f"Failed to scrape {kind} {url}: {e}")
+        return None
+
+    # Each record is written out as soon as its page (and every page before
+    # it) is scraped, so memory stays flat and `python -m app.embedder
+    # --follow` can start right away. executor.map keeps the input order.
+    # OUTPUT_PATH always gets the whole corpus; a new numbered changes file
+    # only what changed in this run. The crawl state already counts those
+    # pages as current, so the changes file is kept even if the run fails.
+    counts = {"new": 0, "changed": 0, "unchanged": 0, "missing": 0, "removed": 0, "failed": 0}
+    changes = RecordWriter(next_changes_path())
+    try:
+        with RecordWriter(OUTPUT_PATH) as writer, ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            for (kind, url), (record, page) in zip(jobs, executor.map(scrape, enumerate(jobs))):
+                if page is not None and page["status"] == 304:
+                    record = state.record(url)
+                    state.touch(url)
+                    counts["unchanged"] += 1
+                elif record is None:
+                    # Keep the last good copy rather than dropping the page.
+                    record = state.record(url)
+                    state.listed(url)
+                    counts["failed"] += 1
+                elif state.save(record, page and page["etag"], page and page["last_modified"]):
+                    counts["changed" if url in known else "new"] += 1
+                    changes.write(record)
+                else:
+                    counts["unchanged"] += 1
+                if record is not None:
+                    writer.write(record)
+
+            # Pages no longer linked from the site are deleted downstream once
+            # they stay missing; until then their last copy is kept, so the
+            # default (full-diff) embedder run doesn't delete them either.
+            listed = {url for kind, url in jobs}
+            missing = {url: kind for url, kind in known.items() if url not in listed}
+            if len(missing) > MAX_REMOVED_FRACTION * len(known) and not args.allow_removals:
+                print(f"{len(missing)} of {len(known)} known pages are missing from the link lists; "
+                      f"keeping them all (check the lists, or pass --allow-removals)")
+                missing_runs = {url: 0 for url in missing}
+            else:
+                missing_runs = {url: state.mark_missing(url) for url in missing}
+            for url, kind in missing.items():
+                if missing_runs[url] >= REMOVE_AFTER_RUNS:
+                    changes.write({"url": url, "type": kind, "deleted": True})
+                    state.delete(url)
+                    counts["removed"] += 1
+                else:
+                    writer.write(state.record(url))
+                    counts["missing"] += 1
+    finally:
+        fetcher.shutdown(cancel_futures=True)
+        pool.close()
+        state.close()
+        changes.close()
+        if not changes.count:
+            changes.path.unlink()
+
+    print(f"\nSaved {writer.count} records to {OUTPUT_PATH.resolve()}")
+    print(", ".join(f"{name}: {count}" for name, count in counts.items()))
+    if changes.count:
+        print(f"Saved {changes.count} changes to {changes.path.resolve()}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from .context_packer import count_tokens, get_encoding, truncate_tokens
+
+# "memory" keeps sessions in the worker process (a session then sticks to
+# one worker); "redis" shares them between gunicorn workers and hosts.
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+# Recent turns kept verbatim; older ones are folded into the summary, which
+# is capped at SESSION_SUMMARY_TOKENS (oldest text is dropped first).
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "4"))
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "200"))
+# Answers are stored cut to this many tokens; the rewriter only needs the gist.
+SESSION_ANSWER_TOKENS = int(os.getenv("SESSION_ANSWER_TOKENS", "120"))
+
+def new_session():
+    return {"summary": "", "turns": []}
+
+def first_sentence(text):
+    match = re.match(r"(.+?[.!?])(\s|$)", text.strip(), re.S)
+    return match.group(1) if match else text.strip()
+
+def keep_last_tokens(text, max_tokens):
+    encoding = get_encoding()
+    if encoding:
+        return encoding.decode(encoding.encode(text)[-max_tokens:])
+    return text[-max_tokens * 4:]
+
+def add_turn(session, question, answer):
+    """
+    Append a turn and compact the session: turns beyond SESSION_MAX_TURNS
+    become one "Q / A" line each in the summary (question plus the first
+    sentence of the answer), and the summary keeps only its newest tokens.
+    """
+    answer = truncate_tokens(answer, SESSION_ANSWER_TOKENS)
+    session["turns"].append({"question": question, "answer": answer})
+    overflow = session["turns"][:-SESSION_MAX_TURNS]
+    if overflow:
+        session["turns"] = session["turns"][-SESSION_MAX_TURNS:]
+        lines = [session["summary"]] if session["summary"] else []
+        lines += [f"Q: {turn['question']} A: {first_sentence(turn['answer'])}" for turn in overflow]
+        summary = "\n".join(lines)
+        if count_tokens(summary) > SESSION_SUMMARY_TOKENS:
+            summary = keep_last_tokens(summary, SESSION_SUMMARY_TOKENS)
+        session["summary"] = summary
+    return session
+
+class MemorySessionStore:
+    """
+    In-process session store: LRU-bounded to max_sessions, entries expire
+    ttl seconds after their last update. Meant to be used from the event
+    loop thread only.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=SESSION_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session id -> (session, expires_at)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def get(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self._sessions[session_id]
+            return None
+        return entry[0]
+
+    async def put(self, session_id, session):
+        self._sessions[session_id] = (session, time.monotonic() + self.ttl)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    async def close(self):
+        self._sessions.clear()
+
+class RedisSessionStore:
+    """Sessions as JSON strings in Redis with a TTL; shared by every worker."""
+
+    def __init__(self, url=SESSION_REDIS_URL, ttl=SESSION_TTL, prefix="chat-session:"):
+        # Optional dependency: only needed when SESSION_STORE=redis.
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, session_id):
+        raw = await self.client.get(self.prefix + session_id)
+        return json.loads(raw) if raw is not None else None
+
+    async def put(self, session_id, session):
+        await self.client.set(self.prefix + session_id, json.dumps(session, ensure_ascii=False), ex=int(self.ttl))
+
+    async def close(self):
+        await self.client.aclose()
+
+def create_session_store():
+    """Return the session store selected by SESSION_STORE."""
+    if SESSION_STORE == "memory":
+        return MemorySessionStore()
+    if SESSION_STORE == "redis":
+        return RedisSessionStore()
+    raise ValueError(f"Unknown SESSION_STORE: {SESSION_STORE!r}")
@@ -1,22 +1,102 @@
 import os
+import asyncio
+from collections import defaultdict
+import numpy as np
 from dotenv import load_dotenv
 from pinecone import Pinecone
+from .coalesce import SingleFlight
+from .metrics import ERRORS, QUERY_ROUTES, STAGE_SECONDS
+from .query_router import classify_question
+from .rerank import mmr
+from .request_log import log
+from .cache import LRUCache, RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL, normalize_question
 
 load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_HOST = os.getenv("PINECONE_HOST")
 PINECONE_NAMESPACE = "default"
+# Connections the Pinecone client keeps to the index host (shared by all
+# searches and vector fetches in this process).
+PINECONE_POOL_SIZE = int(os.getenv("PINECONE_POOL_SIZE", "64"))
+# "pinecone" (hosted integrated search) or "local" (in-process NumPy index
+# exported with `python -m app.local_index`).
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "pinecone")
+# Questions per search_many call when retrieving for /chat/batch.
+RETRIEVAL_BATCH_SIZE = int(os.getenv("RETRIEVAL_BATCH_SIZE", "32"))
+# Score-aware selection: fetch RETRIEVAL_OVERFETCH x top_k candidates, drop
+# those scoring below RETRIEVAL_MIN_SCORE and cut the list at the first drop
+# between neighbours of at least RETRIEVAL_SCORE_GAP (the "elbow"; a decisive
+# top hit is returned alone).
+RETRIEVAL_OVERFETCH = int(os.getenv("RETRIEVAL_OVERFETCH", "3"))
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.2"))
+RETRIEVAL_SCORE_GAP = float(os.getenv("RETRIEVAL_SCORE_GAP", "0.15"))
+# Hybrid retrieval: a local BM25 index over the scraped pages is queried next
+# to the vector search and both rankings are merged by reciprocal rank fusion.
+# Lexical hits scoring below BM25_MIN_RATIO x the best lexical hit are ignored.
+# BM25 scores have no absolute scale, so relevance is decided by the vector
+# cut-off alone: lexical hits only re-rank and extend a non-empty vector result.
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_MIN_RATIO = float(os.getenv("BM25_MIN_RATIO", "0.5"))
+# Diversity re-ranking: the over-fetched candidates that clear the cut-off are
+# narrowed to top_k by maximal marginal relevance over their vectors.
+MMR_RERANK = os.getenv("MMR_RERANK", "1") == "1"
+VECTOR_CACHE_SIZE = int(os.getenv("VECTOR_CACHE_SIZE", "20000"))
 
-def query_pinecone(question, top_k=5):
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    index = pc.Index(host=PINECONE_HOST)
+_index = None
+_retriever = None
+_lexical_index = None
+retrieval_cache = LRUCache(ttl=RETRIEVAL_CACHE_TTL, maxsize=RETRIEVAL_CACHE_SIZE)
+vector_cache = LRUCache(ttl=RETRIEVAL_CACHE_TTL, maxsize=VECTOR_CACHE_SIZE)
+inflight_searches = SingleFlight()
 
+def init_index():
+    """Create the process-wide Pinecone index client (idempotent)."""
+    global _index
+    if _index is None:
+        # The SDK sizes each Index's httpx pool from the client's
+        # connection_pool_maxsize (httpx's default is only 20 connections).
+        pc = Pinecone(api_key=PINECONE_API_KEY, connection_pool_maxsize=PINECONE_POOL_SIZE)
+        _index = pc.Index(host=PINECONE_HOST)
+    return _index
+
+def get_index():
+    return _index if _index is not None else init_index()
+
+def warm_index():
+    # A cheap stats call opens (and keeps alive) the TLS connection so the
+    # first user question doesn't pay for the handshake.
+    get_index().describe_index_stats()
+
+def close_index():
+    global _index
+    if _index is not None:
+        close = getattr(_index, "close", None)
+        if close is not None:
+            close()
+        _index = None
+
+def hit_value(hit, *keys, default=None):
+    # Older SDKs expose hits under the wire names ("_id", "_score"), newer
+    # ones as "id" / "score"; take whichever is present.
+    for key in keys:
+        if key in hit:
+            return hit[key]
+    return default
+
+def query_pinecone(question, top_k=5, types=None):
+    index = get_index()
+
+    query = {
+        "inputs": {"text": question},
+        "top_k": top_k
+    }
+    if types:
+        # Only search records of the content types the question was routed to.
+        query["filter"] = {"type": {"$in": list(types)}}
     results = index.search(
         namespace=PINECONE_NAMESPACE,
-        query={
-            "inputs": {"text": question},
-            "top_k": top_k
-        },
+        query=query,
         fields=["title", "url", "type", "content"]
     )
 
@@ -28,9 +108,259 @@ def query_pinecone(question, top_k=5):
         # Only add if content exists
         if 'content' in fields and fields['content'].strip():
             chunk = {
+                "id": hit_value(hit, "_id", "id", default=""),
                 "title": fields.get("title", ""),
                 "url": fields.get("url", ""),
-                "content": fields["content"]
+                "type": fields.get("type", ""),
+                "content": fields["content"],
+                "score": hit_value(hit, "_score", "score", default=0.0)
             }
             context_chunks.append(chunk)
-    return context_chunks
\ No newline at end of file
+    return context_chunks
+
+def fetch_vectors(ids):
+    """Return {id: embedding} for the given record ids (unknown ids are left out)."""
+    response = get_index().fetch(ids=list(ids), namespace=PINECONE_NAMESPACE)
+    return {vector_id: vector.values for vector_id, vector in response.vectors.items()}
+
+def select_hits(context_chunks, top_k=5, min_score=RETRIEVAL_MIN_SCORE, score_gap=RETRIEVAL_SCORE_GAP):
+    """Keep at most top_k scored chunks, dropping weak hits and everything past the elbow."""
+    ranked = sorted(context_chunks, key=lambda chunk: chunk["score"], reverse=True)
+    selected = []
+    for chunk in ranked[:top_k]:
+        if chunk["score"] < min_score:
+            break
+        if selected and selected[-1]["score"] - chunk["score"] >= score_gap:
+            break
+        selected.append(chunk)
+    return selected
+
+def init_lexical_index():
+    """Build the BM25 index from the scraped pages (no-op when hybrid search is off)."""
+    global _lexical_index
+    if HYBRID_SEARCH and _lexical_index is None:
+        from .bm25 import BM25Index
+        from .corpus import iter_records
+        _lexical_index = BM25Index.from_records(iter_records())
+        print(f"BM25 index built over {len(_lexical_index)} chunks")
+    return _lexical_index
+
+def lexical_hits(question, top_k, types=None):
+    if _lexical_index is None:
+        return []
+    hits = _lexical_index.search(question, top_k, types)
+    if not hits:
+        return []
+    floor = hits[0][1] * BM25_MIN_RATIO
+    return [chunk for chunk, score in hits if score >= floor]
+
+def reciprocal_rank_fusion(rankings, top_k=5, k=RRF_K):
+    """
+    Merge ranked chunk lists by summing 1 / (k + rank) per chunk id. The first
+    list's chunk dict wins for duplicates (it carries the vector score).
+    """
+    fused, chunks = defaultdict(float), {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, start=1):
+            chunk_id = chunk.get("id") or chunk["url"]
+            fused[chunk_id] += 1.0 / (k + rank)
+            chunks.setdefault(chunk_id, chunk)
+    best = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [{**chunks[chunk_id], "rrf_score": fused[chunk_id]} for chunk_id in best]
+
+def combine_hits(selected, lexical, top_k):
+    """
+    Fuse lexical hits into the selected vector hits. The result is never
+    longer than the vector selection, so the relevance cut-off (including a
+    decisive hit sent alone) decides how many chunks reach the prompt;
+    lexical hits can only re-rank or displace weaker vector hits.
+    """
+    selected = selected[:top_k]
+    if not selected or not lexical:
+        return selected
+    return reciprocal_rank_fusion([selected, lexical], len(selected))
+
+async def diversify(retriever, candidates, top_k):
+    """
+    Apply the relevance cut-off to vector candidates, then pick top_k of the
+    survivors by MMR so near-duplicate chunks don't crowd out the prompt.
+    Falls back to score order when the vectors can't be fetched.
+    """
+    selected = select_hits(candidates, len(candidates))
+    if not MMR_RERANK or len(selected) < 2:
+        return selected[:top_k]
+    # The "rerank" stage includes the vector fetch: on a cold vector cache
+    # that is one more round trip to the index after the search.
+    with STAGE_SECONDS.time(stage="rerank"):
+        vectors = {chunk["id"]: vector_cache.get(chunk["id"]) for chunk in selected}
+        missing = [chunk_id for chunk_id, vector in vectors.items() if vector is None]
+        if missing:
+            try:
+                fetched = await asyncio.to_thread(retriever.vectors, missing)
+            except Exception as e:
+                ERRORS.inc(stage="rerank")
+                log(f"Fetching vectors for re-ranking failed: {e}")
+                return selected[:top_k]
+            for chunk_id, vector in fetched.items():
+                vector_cache.put(chunk_id, vector)
+                vectors[chunk_id] = vector
+        dim = next((len(v) for v in vectors.values() if v is not None), 0)
+        if dim == 0:
+            return selected[:top_k]
+        matrix = np.zeros((len(selected), dim), dtype=np.float32)
+        for row, chunk in enumerate(selected):
+            if vectors[chunk["id"]] is not None:
+                matrix[row] = vectors[chunk["id"]]
+        order = mmr([chunk["score"] for chunk in selected], matrix, top_k)
+    return [selected[i] for i in order]
+
+class PineconeRetriever:
+    name = "pinecone"
+    # Integrated search takes one query per request, so batches gain nothing
+    # from search_many; retrieve_many_async runs one search per question in
+    # parallel instead.
+    batched = False
+    # The index embeds the question text itself.
+    uses_question_vector = False
+
+    def warm(self):
+        warm_index()
+
+    def close(self):
+        close_index()
+
+    def search(self, question, top_k=5, types=None, vector=None):
+        # Integrated search embeds the text server-side; `vector` is unused.
+        return query_pinecone(question, top_k, types)
+
+    def search_many(self, questions, top_k=5, types=None):
+        types = types or [None] * len(questions)
+        return [query_pinecone(question, top_k, t) for question, t in zip(questions, types)]
+
+    def vectors(self, ids):
+        return fetch_vectors(ids)
+
+def get_retriever():
+    """Return the process-wide retriever selected by RETRIEVER_BACKEND."""
+    global _retriever
+    if _retriever is None:
+        if RETRIEVER_BACKEND == "pinecone":
+            _retriever = PineconeRetriever()
+        elif RETRIEVER_BACKEND == "local":
+            from .local_index import LocalRetriever
+            _retriever = LocalRetriever()
+        else:
+            raise ValueError(f"Unknown RETRIEVER_BACKEND: {RETRIEVER_BACKEND!r}")
+    return _retriever
+
+async def search_hybrid(retriever, question, top_k, types=None, vector=None):
+    """Vector and BM25 search for one question (in parallel), fused and cut; `vector` is its embedding, if known."""
+    # Retriever searches are blocking (network or embedding calls); run
+    # them in the default thread pool so they never stall the event loop.
+    try:
+        with STAGE_SECONDS.time(stage="retrieval"):
+            candidates, lexical = await asyncio.gather(
+                asyncio.to_thread(retriever.search, question, top_k * RETRIEVAL_OVERFETCH, types, vector),
+                asyncio.to_thread(lexical_hits, question, top_k, types),
+            )
+    except Exception:
+        ERRORS.inc(stage="retrieval")
+        raise
+    return combine_hits(await diversify(retriever, candidates, top_k), lexical, top_k)
+
+async def retrieve_async(question, top_k=5, vector=None):
+    """
+    Return up to top_k relevant chunks (possibly none) for a question. Pass
+    the question's embedding as `vector` when it is already known; retrievers
+    that embed locally then skip their own embedding call.
+    """
+    retriever = get_retriever()
+    key = (retriever.name, normalize_question(question), top_k)
+    cached = retrieval_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def search():
+        types = classify_question(question)
+        context_chunks = await search_hybrid(retriever, question, top_k, types, vector)
+        if types and not context_chunks:
+            # The router may be wrong; give the whole corpus a chance.
+            QUERY_ROUTES.inc(route="fallback")
+            context_chunks = await search_hybrid(retriever, question, top_k, vector=vector)
+        else:
+            QUERY_ROUTES.inc(route="+".join(types) if types else "unrouted")
+        retrieval_cache.put(key, context_chunks)
+        return context_chunks
+
+    return await inflight_searches.do(key, search)
+
+
+async def retrieve_many_async(questions, top_k=5):
+    """
+    Retrieve context for many questions. Cache misses are searched in batches
+    of RETRIEVAL_BATCH_SIZE, all batches in parallel on the default thread
+    pool: one search_many call per batch for retrievers that really batch
+    (the local index), one search per question otherwise. Returns one list of
+    chunks per question, or the exception raised while retrieving it.
+    """
+    retriever = get_retriever()
+    keys = [(retriever.name, normalize_question(q), top_k) for q in questions]
+    results = [retrieval_cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    batches = [missing[i: i + RETRIEVAL_BATCH_SIZE] for i in range(0, len(missing), RETRIEVAL_BATCH_SIZE)]
+    routes = {i: classify_question(questions[i]) for i in missing}
+
+    async def search_each(batch):
+        found = await asyncio.gather(
+            *(
+                asyncio.to_thread(retriever.search, questions[i], top_k * RETRIEVAL_OVERFETCH, routes[i])
+                for i in batch
+            ),
+            return_exceptions=True,
+        )
+        for candidates in found:
+            if isinstance(candidates, Exception):
+                ERRORS.inc(stage="retrieval")
+        return found
+
+    async def finish(i, candidates, lexical_chunks):
+        if isinstance(candidates, Exception):
+            results[i] = candidates
+            return
+        selected = await diversify(retriever, candidates, top_k)
+        results[i] = combine_hits(selected, lexical_chunks, top_k)
+        if routes[i] and not results[i]:
+            QUERY_ROUTES.inc(route="fallback")
+            try:
+                results[i] = await search_hybrid(retriever, questions[i], top_k)
+            except Exception as e:
+                results[i] = e
+                return
+        else:
+            QUERY_ROUTES.inc(route="+".join(routes[i]) if routes[i] else "unrouted")
+        retrieval_cache.put(keys[i], results[i])
+
+    async def run_batch(batch):
+        types = [routes[i] for i in batch]
+        lexical = asyncio.create_task(
+            asyncio.to_thread(lambda: [lexical_hits(questions[i], top_k, routes[i]) for i in batch])
+        )
+        with STAGE_SECONDS.time(stage="retrieval"):
+            if retriever.batched:
+                try:
+                    found = await asyncio.to_thread(
+                        retriever.search_many, [questions[i] for i in batch], top_k * RETRIEVAL_OVERFETCH, types
+                    )
+                except Exception:
+                    ERRORS.inc(stage="retrieval")
+                    # Retry one by one so a single bad question doesn't fail the batch.
+                    found = await search_each(batch)
+            else:
+                found = await search_each(batch)
+        await asyncio.gather(*(
+            finish(i, candidates, lexical_chunks)
+            for i, candidates, lexical_chunks in zip(batch, found, await lexical)
+        ))
+
+    await asyncio.gather(*(run_batch(batch) for batch in batches))
+    return results
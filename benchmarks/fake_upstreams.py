@@ -0,0 +1,160 @@
+"""
+Offline stand-ins for the Pinecone data plane and the OpenAI API, so the
+backend can be load-tested without network access or API spend.
+
+Both upstreams are served by one app on one port; point the backend at it with
+PINECONE_HOST=http://127.0.0.1:<port> and OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBEDDING_DIM = 64
+ANSWER = (
+    "KITKAT Chocolate Wafer Bar (45 g) has 210 calories. "
+    "See https://www.madewithnestle.ca/kitkat/kitkat-chocolate-wafer-bar for details."
+)
+HITS = [
+    {
+        "_id": f"product-{i}",
+        "_score": 0.9 - i * 0.05,
+        "fields": {
+            "title": f"KITKAT product {i}",
+            "url": f"https://www.madewithnestle.ca/kitkat/product-{i}",
+            "type": "product",
+            "content": "Nutrition Information:\nCalories: 210\nFat: 11 g (15 %)\n" * 5,
+        },
+    }
+    for i in range(10)
+]
+
+def create_app(pinecone_latency=0.05, openai_latency=0.4, jitter=0.2, error_rate=0.0, token_delay=0.01):
+    app = FastAPI()
+
+    async def upstream_delay(latency):
+        # Latency varies uniformly by +/- jitter (as a fraction of latency).
+        await asyncio.sleep(max(0.0, latency * (1 + random.uniform(-jitter, jitter))))
+        if random.random() < error_rate:
+            return JSONResponse({"error": {"message": "injected failure"}}, status_code=503)
+        return None
+
+    # --- Pinecone ---------------------------------------------------------
+
+    @app.api_route("/describe_index_stats", methods=["GET", "POST"])
+    async def describe_index_stats():
+        return {"namespaces": {"default": {"vectorCount": len(HITS)}}, "dimension": 1024,
+                "indexFullness": 0.0, "totalVectorCount": len(HITS)}
+
+    @app.post("/records/namespaces/{namespace}/search")
+    async def search_records(namespace: str, request: Request):
+        body = await request.json()
+        error = await upstream_delay(pinecone_latency)
+        if error:
+            return error
+        top_k = body.get("query", {}).get("top_k", 5)
+        return {"result": {"hits": HITS[:top_k]}, "usage": {"read_units": 1}}
+
+    @app.post("/records/namespaces/{namespace}/upsert")
+    async def upsert_records(namespace: str, request: Request):
+        records = [line for line in (await request.body()).splitlines() if line.strip()]
+        error = await upstream_delay(pinecone_latency)
+        if error:
+            return error
+        return JSONResponse({"upsertedCount": len(records)}, status_code=201)
+
+    @app.post("/vectors/delete")
+    async def delete_vectors(request: Request):
+        await request.json()
+        error = await upstream_delay(pinecone_latency)
+        if error:
+            return error
+        return {}
+
+    @app.get("/vectors/fetch")
+    async def fetch_vectors(request: Request):
+        ids = request.query_params.getlist("ids")
+        error = await upstream_delay(pinecone_latency)
+        if error:
+            return error
+        vectors = {}
+        for vector_id in ids:
+            rng = random.Random(hashlib.sha256(vector_id.encode("utf-8")).digest())
+            vectors[vector_id] = {"id": vector_id, "values": [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)]}
+        return {"vectors": vectors, "namespace": request.query_params.get("namespace", ""),
+                "usage": {"readUnits": 1}}
+
+    # --- OpenAI -----------------------------------------------------------
+
+    @app.get("/v1/models/{model}")
+    async def retrieve_model(model: str):
+        return {"id": model, "object": "model", "created": 0, "owned_by": "bench"}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        error = await upstream_delay(pinecone_latency)
+        if error:
+            return error
+        data = []
+        for i, text in enumerate(inputs):
+            # Deterministic pseudo-embedding: identical text, identical vector.
+            rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+            data.append({"object": "embedding", "index": i,
+                         "embedding": [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)]})
+        return {"object": "list", "data": data, "model": body["model"],
+                "usage": {"prompt_tokens": 8 * len(inputs), "total_tokens": 8 * len(inputs)}}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error = await upstream_delay(openai_latency)
+        if error:
+            return error
+        prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+        completion_tokens = len(ANSWER) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        base = {"id": "chatcmpl-bench", "created": int(time.time()), "model": body["model"]}
+        if not body.get("stream"):
+            return {**base, "object": "chat.completion", "usage": usage, "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": ANSWER}}
+            ]}
+
+        async def chunks():
+            for word in ANSWER.split(" "):
+                await asyncio.sleep(token_delay)
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "finish_reason": None, "delta": {"content": word + " "}}
+                ]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            if body.get("stream_options", {}).get("include_usage"):
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--pinecone-latency", type=float, default=0.05, help="seconds per search/embedding call")
+    parser.add_argument("--openai-latency", type=float, default=0.4, help="seconds per chat completion")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency jitter as a fraction of latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with HTTP 503")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed tokens")
+    args = parser.parse_args()
+    app = create_app(args.pinecone_latency, args.openai_latency, args.jitter, args.error_rate, args.token_delay)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Drive the chat backend at a fixed concurrency and report throughput and
+latency percentiles as JSON.
+
+By default the backend (app.main) and the fake upstreams
+(benchmarks.fake_upstreams) are started as subprocesses, so a run needs no
+network access. Pass --target to benchmark an already running backend.
+
+    python -m benchmarks.load_test --requests 1000 --concurrency 50 --output run.json
+    python -m benchmarks.load_test --output after.json --compare run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+QUESTIONS = [
+    "How many calories are in a KITKAT bar?",
+    "What are the ingredients of AERO milk chocolate?",
+    "Give me a recipe that uses SMARTIES.",
+    "Which TURTLES products are available?",
+    "Does Nestlé have gluten free recipes?",
+]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 2) if latencies else None,
+        **{f"p{p}_ms": round(1000 * percentile(latencies, p), 2) if latencies else None for p in (50, 95, 99)},
+        "max_ms": round(1000 * latencies[-1], 2) if latencies else None,
+    }
+
+def make_question(i, distinct):
+    # With --distinct N, questions repeat every N requests (exercising the
+    # caches); 0 makes every question unique.
+    n = i % distinct if distinct else i
+    return f"{QUESTIONS[n % len(QUESTIONS)]} (#{n})"
+
+async def one_request(client, endpoint, question, batch_size):
+    if endpoint == "/chat/batch":
+        r = await client.post(endpoint, json={"questions": [f"{question} [{j}]" for j in range(batch_size)]})
+        r.raise_for_status()
+        return None
+    if endpoint == "/chat/stream":
+        first_token = None
+        start = time.perf_counter()
+        async with client.stream("POST", endpoint, json={"question": question}) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if first_token is None and line == "event: token":
+                    first_token = time.perf_counter() - start
+                if line == "event: error":
+                    raise RuntimeError("error event in stream")
+        return first_token
+    r = await client.post(endpoint, json={"question": question})
+    r.raise_for_status()
+    if r.json().get("answer", "").startswith("Error:"):
+        raise RuntimeError(r.json()["answer"])
+    return None
+
+async def run_load(base_url, endpoint, total, concurrency, distinct, batch_size, timeout):
+    latencies, first_tokens, errors = [], [], {}
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker():
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    first_token = await one_request(client, endpoint, make_question(i, distinct), batch_size)
+                except Exception as e:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if first_token is not None:
+                    first_tokens.append(first_token)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    results = {
+        "elapsed_s": round(elapsed, 3),
+        "requests": total,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency": summarize(latencies),
+    }
+    if first_tokens:
+        results["time_to_first_token"] = summarize(first_tokens)
+    return results
+
+def start_stack(args, env_dir):
+    """Start the fake upstreams and the backend; return (base_url, processes)."""
+    upstream_port, app_port = free_port(), free_port()
+    upstreams = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_upstreams", "--port", str(upstream_port),
+        "--pinecone-latency", str(args.pinecone_latency), "--openai-latency", str(args.openai_latency),
+        "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+        "--token-delay", str(args.token_delay),
+    ], cwd=ROOT)
+    env = {
+        **os.environ,
+        "PINECONE_API_KEY": "bench",
+        "PINECONE_HOST": f"http://127.0.0.1:{upstream_port}",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{upstream_port}/v1",
+        "CORPUS_VERSION_PATH": str(Path(env_dir) / "corpus_version.txt"),
+    }
+    backend = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ], cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    wait_for_port(upstream_port)
+    wait_for_port(app_port)
+    return f"http://127.0.0.1:{app_port}", [backend, upstreams]
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+def print_comparison(report, baseline):
+    print(f"\nCompared with {baseline.get('revision')} ({baseline.get('timestamp')}):")
+    rows = [("throughput_rps", report["results"]["throughput_rps"], baseline["results"]["throughput_rps"])]
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        rows.append((f"latency {key}", report["results"]["latency"][key], baseline["results"]["latency"][key]))
+    for name, now, before in rows:
+        if now is None or not before:
+            continue
+        print(f"  {name:<18} {before:>10} -> {now:>10}  ({(now - before) / before * 100:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="base URL of a running backend (skips starting the local stack)")
+    parser.add_argument("--endpoint", default="/chat", choices=["/chat", "/chat/stream", "/chat/batch"])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--distinct", type=int, default=0, help="number of distinct questions (0 = all unique)")
+    parser.add_argument("--batch-size", type=int, default=10, help="questions per /chat/batch request")
+    parser.add_argument("--warmup", type=int, default=10, help="requests sent before measuring")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local backend")
+    parser.add_argument("--pinecone-latency", type=float, default=0.05)
+    parser.add_argument("--openai-latency", type=float, default=0.4)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed fake OpenAI tokens")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="JSON report of a previous run to compare against")
+    args = parser.parse_args()
+
+    processes = []
+    with tempfile.TemporaryDirectory() as env_dir:
+        try:
+            base_url = args.target
+            if base_url is None:
+                base_url, processes = start_stack(args, env_dir)
+            if args.warmup:
+                asyncio.run(run_load(base_url, args.endpoint, args.warmup, min(args.warmup, args.concurrency),
+                                     1, args.batch_size, args.timeout))
+            results = asyncio.run(run_load(base_url, args.endpoint, args.requests, args.concurrency,
+                                           args.distinct, args.batch_size, args.timeout))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.compare:
+        print_comparison(report, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,8 @@ export default function Chatbot() {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
   const textareaRef = useRef(null);
+  // One conversation per page load, so follow-up questions keep their context
+  const sessionIdRef = useRef(crypto.randomUUID());
 
   // Ref for auto-scrolling
   const messagesEndRef = useRef(null);
@@ -64,15 +66,61 @@ export default function Chatbot() {
     try {
       const apiUrl = process.env.REACT_APP_API_URL || "http://localhost:8000";
       console.log("API URL:", apiUrl); // add this for debugging
-      const res = await fetch(`${apiUrl}/chat`, {
+      const res = await fetch(`${apiUrl}/chat/stream`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ question: userMsg.text }),
+      body: JSON.stringify({ question: userMsg.text, session_id: sessionIdRef.current }),
       });
 
-      if (!res.ok) throw new Error("Failed to fetch");
-      const data = await res.json();
-      setMessages((msgs) => [...msgs, { sender: "bot", text: data.answer }]);
+      if (!res.ok || !res.body) throw new Error("Failed to fetch");
+
+      // Read server-sent events off the response body and grow the bot
+      // message as tokens arrive.
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let started = false;
+      // Sources arrive before the first token; they are shown under the answer
+      let sources = [];
+      let streamError = "";
+      const appendToBot = (text) => {
+        if (!started) {
+          started = true;
+          setLoading(false);
+          setMessages((msgs) => [...msgs, { sender: "bot", text, sources }]);
+          return;
+        }
+        setMessages((msgs) => {
+          const last = msgs[msgs.length - 1];
+          return [...msgs.slice(0, -1), { ...last, text: last.text + text }];
+        });
+      };
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf("\n\n")) !== -1) {
+          const block = buffer.slice(0, sep);
+          buffer = buffer.slice(sep + 2);
+          let event = "message";
+          let data = "";
+          for (const line of block.split("\n")) {
+            if (line.startsWith("event:")) event = line.slice(6).trim();
+            else if (line.startsWith("data:")) data += line.slice(5).trim();
+          }
+          if (event === "token") appendToBot(JSON.parse(data).text);
+          else if (event === "sources") sources = JSON.parse(data);
+          else if (event === "error") streamError = JSON.parse(data).message;
+        }
+      }
+      // Errors are shown apart from the (possibly partial) answer
+      if (streamError) {
+        setError(streamError);
+        return;
+      }
+      if (!started) throw new Error("Empty response");
     } catch (e) {
       setMessages((msgs) => [
         ...msgs,
@@ -199,6 +247,23 @@ export default function Chatbot() {
                 >
                   {m.sender === "bot" ? renderWithLinks(m.text) : m.text}
                 </span>
+                {m.sources && m.sources.length > 0 && (
+                  <div style={{ marginTop: 4, fontSize: 12, color: "#666" }}>
+                    Sources:
+                    {[...new Map(m.sources.map((s) => [s.url, s])).values()].map((s) => (
+                      <div key={s.url}>
+                        <a
+                          href={s.url}
+                          target="_blank"
+                          rel="noopener noreferrer"
+                          style={{ color: "#459cff", textDecoration: "underline" }}
+                        >
+                          {s.title || s.url}
+                        </a>
+                      </div>
+                    ))}
+                  </div>
+                )}
               </div>
             ))}
             {loading && (